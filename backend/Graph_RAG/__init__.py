@@ -1,22 +1,33 @@
-from .Graph_RAG_Search import chain
-from .config import debug, retry
-from .base import graph
+from .Graph_RAG_Search import chain, _search_query
+from .get_retriever import entity_index, aentities, neighborhood, format_context
+from .config import debug, retry, write_batch_size, write_retries, concurrency, rate_limit, backoff, flush_chunks, progress_dir
+from .base import graph, graph_version
+from .writer import GraphWriter
+from .pipeline import RateLimiter, Progress
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain.text_splitter import CharacterTextSplitter
-from tqdm import tqdm, trange
+from tqdm import tqdm
 import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langchain_core.documents import Document
-import threading
+from cache import LRUCache
 
 __all__ = (
     'GraphRAG'
 )
 
 class GraphRAG:
-    def __init__(self, chunk_size=256, chunk_overlap=64):
+    def __init__(self, chunk_size=256, chunk_overlap=64, cache_size=1024):
         self.chain = chain
         self.retry = retry
         self.graph = graph
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.limiter = RateLimiter(rate_limit)  # 多个线程共享, 限制 LLM 接口的请求速率
+        # 检索结果按 (独立问题, 图谱版本) 缓存, 图谱更新后版本号改变, 旧结果不再命中
+        self.cache = LRUCache(maxsize=cache_size)
         self.text_splitter = CharacterTextSplitter(separator="", chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
     def __call__(self, req):
@@ -34,6 +45,40 @@ class GraphRAG:
             return ''
         return res
 
+    async def _stage(self, name, fn, *args):
+        # 单个阶段失败时只重试该阶段
+        for i in range(self.retry):
+            try:
+                return await fn(*args)
+            except Exception as e:
+                print(f'ERROR: 图谱检索阶段 {name} 失败_{i}!', str(e))
+                if i + 1 < self.retry:
+                    await asyncio.sleep(backoff * 2 ** i)
+        raise RuntimeError(f'图谱检索阶段 {name} 多次重试仍然失败')
+
+    async def aquery(self, req, chat_history=None):
+        """
+            _query 的异步版本, 返回格式相同: {'context': 检索结果, 'question': 输入}
+            依次执行 问题改写 -> 实体识别 -> 邻居查询, 每个阶段单独重试; 相同问题且图谱未变化时直接返回缓存
+        """
+        inputs = {"question": req}
+        if chat_history:
+            inputs["chat_history"] = chat_history
+        try:
+            question = await self._stage('condense', _search_query.ainvoke, inputs)
+            key = (question, graph_version.value)
+            context = self.cache.get(key)
+            if context is None:
+                entities = await self._stage('entity', aentities, question)
+                structured = await self._stage('neighborhood', asyncio.to_thread, neighborhood, entities or [])
+                # 没有查到三元组时返回空上下文, 调用方按 'empty' 处理, 提示词中不出现空的 Structured data 段
+                context = format_context(structured) if structured.strip() else ''
+                self.cache.set(key, context)
+        except Exception as e:
+            print('ERROR: 知识库搜索报错!', str(e))
+            return ''
+        return {'context': context, 'question': inputs}
+
     def clear(self, file_name: str = None):
         if file_name:
             file_name = os.path.basename(file_name)
@@ -50,23 +95,32 @@ class GraphRAG:
                 "MATCH (doc:Document {source: $file_name}) DETACH DELETE doc",
                 {"file_name": file_name}
             )
+            Progress.remove(progress_dir, file_name)
         else:
             # 删除所有节点和关系
             self.graph.query("MATCH (n) DETACH DELETE n")
+            Progress.remove(progress_dir)
+        graph_version.bump()
+        entity_index.refresh()
+
+    def _extract(self, llm_transformer, doc):
+        # 抽取单个分块的图谱, 失败时指数退避重试
+        for i in range(self.retry):
+            self.limiter.acquire()
+            try:
+                return llm_transformer.process_response(doc)
+            except Exception as e:
+                print(f'ERROR: 图谱抽取失败_{i}!', str(e))
+                time.sleep(backoff * 2 ** i)
+        return None
 
     def up(self, file_path, llm):
         """
         上传并构建图谱：
         - 为每个文档节点设置 metadata type 为来源文件名
+        - 分块在有界线程池中并发抽取(限速, 失败重试), 抽取结果边完成边批量写入 Neo4j
+        - 每写入一批就记录完成的分块, 中途崩溃后重新上传会从断点继续
         """
-        graph_docs = []
-
-        def Run(doc__, llm_transformer):
-            nonlocal graph_docs
-            res = llm_transformer.process_response(doc__)
-            with threading.Lock():
-                graph_docs.append(res)
-
         if file_path is None:
             return
 
@@ -83,46 +137,69 @@ class GraphRAG:
                 text = f.read()
             file_name = os.path.basename(file_path)
 
-        existing_docs = self.graph.query(
-            "MATCH (doc:Document {source: $file_name}) RETURN doc",
-            {"file_name": file_name}
-        )
-        if existing_docs:
-            print(f"文件 {file_name} 已存在，跳过上传。")
-            return
-        
+        progress = Progress(progress_dir, file_name, text, self.chunk_size, self.chunk_overlap)
+        if not progress.resumed:
+            existing_docs = self.graph.query(
+                "MATCH (doc:Document {source: $file_name}) RETURN doc LIMIT 1",
+                {"file_name": file_name}
+            )
+            if existing_docs:
+                progress.finish()
+                print(f"文件 {file_name} 已存在，跳过上传。")
+                return
+
         doc = Document(text, metadata={"source": file_name})
-        # docs = [doc]
         docs = self.text_splitter.split_documents([doc])
-        graph_docs = []
-
-        thread_num = 3
-        print('---线程数: ', thread_num)
-        print('---文档数: ', len(docs))
-        print('---开始转换文档: ')
-        for star_idx in trange(0, len(docs), thread_num, desc='Transformer', unit='Epoch'):
-            threads = []
-            for i in range(thread_num):
-                if star_idx + i >= len(docs):
-                    break
-                t = threading.Thread(target=Run, args=[docs[star_idx + i], llm_transformer])
-                threads.append(t)
-                t.start()
+        todo = [i for i in range(len(docs)) if i not in progress.done]
+        print('---线程数: ', concurrency)
+        print('---文档数: ', len(docs), ', 已完成: ', len(docs) - len(todo))
+        print('---开始转换并上传文档: ')
 
-            for t in threads:
-                t.join()
+        writer = GraphWriter(self.graph, batch_size=write_batch_size, retries=write_retries, flush_size=None)
+        extracted = []  # 已加入 writer 但尚未写入的分块序号
+        failed = 0
 
-        print('---开始上传文档: ')
-        for x in tqdm(graph_docs, desc='Up', unit='cnt'):
-            try:
-                # 在上传时添加文件名作为 metadata type
-                graph.add_graph_documents(
-                    [x],
-                    baseEntityLabel=True,
-                    include_source=True,
-                )
-            except Exception as e:
-                print('ERROR: 上传文档失败:', str(e))
-                print(x)
+        def flush():
+            nonlocal failed
+            # 同一批中各分块的数据合并去重后写入, 无法区分失败的行属于哪个分块, 有失败时整批都不记录为完成
+            if writer.flush():
+                failed += len(extracted)
+            else:
+                progress.mark(extracted)
+            extracted.clear()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='graph_extract') as executor, \
+                tqdm(total=len(todo), desc='Transformer', unit='chunk') as bar:
+            pending = {}
+            queue = iter(todo)
+            while True:
+                # 最多 2 倍并发数的分块在处理中, 避免一次性提交整本书
+                for i in queue:
+                    pending[executor.submit(self._extract, llm_transformer, docs[i])] = i
+                    if len(pending) >= concurrency * 2:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    res = future.result()
+                    bar.update(1)
+                    if res is None:
+                        failed += 1
+                        continue
+                    writer.add([res])
+                    extracted.append(i)
+                if len(extracted) >= flush_chunks:
+                    flush()
+        flush()
+
+        print('---写入统计: ', writer.stats())
+        graph_version.bump()
+        entity_index.refresh()
+        if failed:
+            print(f'---{failed} 个分块抽取或写入失败, 重新上传该文件可继续处理')
+        else:
+            progress.finish()
         print('---运行结束!')
         print('~' * 100)
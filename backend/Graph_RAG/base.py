@@ -1,6 +1,24 @@
 from langchain_neo4j import Neo4jGraph
 import os
+import threading
 import dotenv
 dotenv.load_dotenv()
 
-graph = Neo4jGraph(refresh_schema=False)
\ No newline at end of file
+graph = Neo4jGraph(refresh_schema=False)
+
+
+class GraphVersion:
+    """
+        图谱版本号, GraphRAG.up()/clear() 修改图谱后加一, 依赖图谱内容的缓存以版本号作为键的一部分
+    """
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            return self.value
+
+
+graph_version = GraphVersion()
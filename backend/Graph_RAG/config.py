@@ -1,2 +1,15 @@
 debug = True
-retry = 3
\ No newline at end of file
+retry = 3
+# Neo4j 批量写入: 每个事务写入的行数, 失败重试次数
+write_batch_size = 1000
+write_retries = 3
+# 图谱抽取: 并发数, LLM 每秒请求数上限(0 不限制), 失败重试的退避基数(秒)
+concurrency = 3
+rate_limit = 0
+backoff = 1.0
+# 每抽取多少个分块写入一次 Neo4j 并记录进度, 以及进度文件目录
+flush_chunks = 50
+progress_dir = 'graph_progress'
+# 图谱检索: 每个实体保留的三元组数, 返回的三元组总数上限
+triple_limit = 10
+max_triples = 50
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+from collections import deque
+from cache import LRUCache
+
+__all__ = (
+    'EntityIndex',
+)
+
+
+def _is_word(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+class _Automaton:
+    """
+        Aho-Corasick 自动机, 一次扫描找出文本中出现的全部词
+    """
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.length = [0]  # 以该节点结尾的词长度, 0 表示不是词尾
+        self.link = [0]  # 沿失败指针最近的词尾节点, 用于输出被包含的短词
+        for word in words:
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.length.append(0)
+                    self.link.append(0)
+                node = nxt
+            self.length[node] = len(word)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                fail = self.fail[nxt]
+                self.link[nxt] = fail if self.length[fail] else self.link[fail]
+
+    def finditer(self, text):
+        # 产出 (起始位置, 结束位置)
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            out = node if self.length[node] else self.link[node]
+            while out:
+                yield i + 1 - self.length[out], i + 1
+                out = self.link[out]
+
+
+class EntityIndex:
+    """
+        图谱实体的本地实体链接:
+        - 从 Neo4j 加载全部 __Entity__ 的 id 构建 Aho-Corasick 自动机, 在问题中做最长匹配
+        - 匹配不到时才调用 fallback(通常为 LLM 抽取)
+        - 问题 -> 实体列表的结果带 LRU 缓存, 图谱变化后调用 refresh() 重建索引并清空缓存
+    """
+    def __init__(self, graph, min_len=2, cache_size=1024):
+        self.graph = graph
+        self.min_len = min_len  # 过短的实体名(如单字)误匹配太多, 不进入索引
+        self.cache = LRUCache(maxsize=cache_size)
+        self._automaton = None
+        self._names = {}  # 小写实体名 -> 原始 id 列表
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.fallbacks = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def refresh(self):
+        rows = self.graph.query("MATCH (e:__Entity__) WHERE e.id IS NOT NULL RETURN e.id AS id")
+        names = {}
+        for row in rows:
+            name = str(row['id']).strip()
+            if len(name) >= self.min_len:
+                names.setdefault(name.lower(), []).append(name)
+        automaton = _Automaton(names.keys())
+        with self._lock:
+            self._names, self._automaton = names, automaton
+            self.cache.clear()
+        print(f'~ 实体索引已更新, 实体数: {len(names)}')
+
+    def match(self, text):
+        # 最左最长匹配, 匹配结果互不重叠
+        if self._automaton is None:
+            self.refresh()
+        with self._lock:
+            automaton, names = self._automaton, self._names
+        text = text.lower()
+        spans = sorted(automaton.finditer(text), key=lambda x: (x[0], x[0] - x[1]))
+        res, end = [], 0
+        for s, e in spans:
+            # 英文实体名需要完整单词匹配, 避免 he 匹配到 ushers 中
+            if (s > 0 and _is_word(text[s]) and _is_word(text[s - 1])) or \
+                    (e < len(text) and _is_word(text[e - 1]) and _is_word(text[e])):
+                continue
+            if s >= end:
+                for name in names[text[s:e]]:
+                    if name not in res:
+                        res.append(name)
+                end = e
+        return res
+
+    def extract(self, question, fallback=None):
+        res = self.cache.get(question)
+        if res is not None:
+            return res
+        res = self.match(question)
+        if res:
+            self.local_hits += 1
+        elif fallback is not None:
+            self.fallbacks += 1
+            res = fallback(question)
+        if res is not None:
+            self.cache.set(question, res)
+        return res
+
+    async def aextract(self, question, fallback=None):
+        # extract 的异步版本, fallback 为协程函数
+        res = self.cache.get(question)
+        if res is not None:
+            return res
+        if self._automaton is None:
+            await asyncio.to_thread(self.refresh)  # 首次加载索引需要查询 Neo4j, 不阻塞事件循环
+        res = self.match(question)
+        if res:
+            self.local_hits += 1
+        elif fallback is not None:
+            self.fallbacks += 1
+            res = await fallback(question)
+        if res is not None:
+            self.cache.set(question, res)
+        return res
+
+    def stats(self):
+        return {
+            'entities': len(self._names),
+            'local_hits': self.local_hits,
+            'fallbacks': self.fallbacks,
+            'cache': self.cache.stats(),
+        }
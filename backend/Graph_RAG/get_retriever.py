@@ -1,11 +1,40 @@
 from langchain_neo4j.vectorstores.neo4j_vector import remove_lucene_chars
 from .get_entity import entity_chain
-from .base import graph
-from .config import debug, retry
+from .base import graph, graph_version
+from .config import debug, retry, triple_limit, max_triples
+from .entity_index import EntityIndex
+from cache import LRUCache
 __all__ = (
-    'retriever'
+    'retriever',
+    'entity_index',
+    'aentities',
+    'neighborhood',
+    'format_context',
 )
 
+# 图谱实体索引, 图谱更新(GraphRAG.up/clear)后刷新
+entity_index = EntityIndex(graph)
+# 实体 -> 邻居三元组, 按 (实体, 图谱版本) 缓存
+neighbor_cache = LRUCache(maxsize=4096)
+
+# 一次查询所有实体: 全文索引定位节点后展开邻居, 每个实体按得分保留前 $limit 条去重后的三元组
+NEIGHBORHOOD_QUERY = """
+UNWIND $entities AS entity
+CALL db.index.fulltext.queryNodes('entity', entity.query, {limit: 2})
+YIELD node, score
+CALL (node) {
+  MATCH (node)-[r:!MENTIONS]->(neighbor)
+  RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
+  UNION ALL
+  MATCH (node)<-[r:!MENTIONS]-(neighbor)
+  RETURN neighbor.id + ' - ' + type(r) + ' -> ' + node.id AS output
+}
+WITH entity, output, max(score) AS score
+ORDER BY score DESC
+WITH entity, collect({output: output, score: score})[..$limit] AS triples
+RETURN entity.name AS entity, triples
+"""
+
 def generate_full_text_query(input: str) -> str:
     """为给定的输入字符串生成全文搜索查询。
 
@@ -22,56 +51,83 @@ def generate_full_text_query(input: str) -> str:
     # return full_text_query.strip()
     return input
 
-def structured_retriever(question: str) -> str:
-    """
-    Collects the neighborhood of entities mentioned
-    in the question
-    """
-    result = ""
-    for i in range(retry): 
+def _llm_entities(question: str):
+    # 通过 LLM 抽取问题中的实体, 格式错误时重试
+    for i in range(retry):
         try:
             entities = entity_chain.invoke({"question": question})
-        
             if isinstance(entities['res'], list):
-                break
+                return entities['res']
         except Exception as e:
             print('ERROR: 格式错误: ', str(e))
-    else:
-        print('ERROR: 多次重试仍然《提取到的实体》格式错误')
+    print('ERROR: 多次重试仍然《提取到的实体》格式错误')
+    return None
+
+async def _allm_entities(question: str):
+    # 异步调用 LLM 抽取实体, 只尝试一次, 由调用方负责重试
+    entities = await entity_chain.ainvoke({"question": question})
+    if not isinstance(entities['res'], list):
+        raise ValueError(f'《提取到的实体》格式错误: {entities}')
+    return entities['res']
+
+async def aentities(question: str):
+    return await entity_index.aextract(question, fallback=_allm_entities)
+
+def neighborhood(entities) -> str:
+    # 查询各实体的邻居三元组, 未缓存的实体合并为一次查询
+    version = graph_version.value
+    triples = {}
+    missing = []
+    for entity in dict.fromkeys(entities):
+        cached = neighbor_cache.get((entity, version))
+        if cached is None:
+            # 全文检索语法中的特殊字符会导致整批查询报错, 替换为空格
+            query = remove_lucene_chars(generate_full_text_query(entity)).strip()
+            if query:
+                missing.append({'name': entity, 'query': query})
+            continue
+        for output, score in cached:
+            triples[output] = max(score, triples.get(output, score))
+    if missing:
+        found = {}
+        for row in graph.query(NEIGHBORHOOD_QUERY, {"entities": missing, "limit": triple_limit}):
+            found[row['entity']] = [(el['output'], el['score']) for el in row['triples']]
+        for entity in missing:
+            res = found.get(entity['name'], [])
+            neighbor_cache.set((entity['name'], version), res)
+            for output, score in res:
+                triples[output] = max(score, triples.get(output, score))
+    if debug:
+        print(f'实体数: {len(entities)}, 查询数: {len(missing)}, 三元组数: {len(triples)}')
+    ranked = sorted(triples.items(), key=lambda x: x[1], reverse=True)[:max_triples]
+    return "\n".join(output for output, _ in ranked)
+
+def structured_retriever(question: str) -> str:
+    """
+    Collects the neighborhood of entities mentioned
+    in the question
+    """
+    # 优先用本地实体索引匹配问题中的实体, 匹配不到时才调用 LLM
+    entities = entity_index.extract(question, fallback=_llm_entities)
+    if entities is None:
         return ''
     if debug:
         print('分割出的实体列表为: ', str(entities))
-    for entity in entities['res']:
-        response = graph.query(
-            """
-            CALL db.index.fulltext.queryNodes('entity', $query, {limit:2})
-            YIELD node,score
-            MATCH (node)-[r]-(neighbor) // 通过这步匹配来明确neighbor的来源，可根据实际关系调整这里的模式
-            CALL (node, neighbor) {
-              MATCH (node)-[r:!MENTIONS]->(neighbor)
-              RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
-              UNION ALL
-              MATCH (node)<-[r:!MENTIONS]-(neighbor)
-              RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
-            }
-            RETURN output LIMIT 10
-            """,
-            {"query": generate_full_text_query(entity)},
-        )
-        if debug:
-            print('generate_full_text_query(entity): ', generate_full_text_query(entity))
-        result += "\n".join([el['output'] for el in response])
+    result = neighborhood(entities)
     return result
     
 
+def format_context(structured_data: str) -> str:
+    return f"""Structured data:
+{structured_data}
+    """
+
 def retriever(question: str):
     if debug:
         print(f"Search query: {question}")
     structured_data = structured_retriever(question)
     # unstructured_data = [el.page_content for el in vector_index.similarity_search(question)]
-    final_data = f"""Structured data:
-{structured_data}
-    """
+    final_data = format_context(structured_data)
     if debug:
         print(f'~ final_data({question}): ', final_data)
     return final_data
\ No newline at end of file
@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import threading
+from hashlib import md5
+
+__all__ = (
+    'RateLimiter',
+    'Progress',
+)
+
+
+class RateLimiter:
+    """
+        线程安全的令牌桶限速, rate 为每秒请求数, 0 或 None 表示不限速
+    """
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Progress:
+    """
+        图谱构建进度, 每个文件一个 jsonl 文件: 第一行记录文本摘要与分块参数, 之后每行为已写入图谱的分块序号.
+        中途崩溃后重新上传同一文件时跳过已完成的分块; 文本或分块参数变化时重新开始.
+    """
+    def __init__(self, progress_dir, file_name, text, chunk_size, chunk_overlap):
+        self.path = os.path.join(progress_dir, file_name + '.jsonl')
+        self.header = {'md5': md5(text.encode('utf-8')).hexdigest(), 'chunk_size': chunk_size,
+                       'chunk_overlap': chunk_overlap}
+        self.done = set()
+        self.resumed = False
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            if lines and json.loads(lines[0]) == self.header:
+                self.done = {int(line) for line in lines[1:] if line.strip()}
+                self.resumed = True
+        if not self.resumed:
+            os.makedirs(progress_dir, exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(self.header) + '\n')
+
+    def mark(self, indices):
+        # 分块写入图谱后再记录, 保证记录的分块一定已经入库
+        if not indices:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(f'{i}\n' for i in indices))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(indices)
+
+    def finish(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def remove(progress_dir, file_name=None):
+        # 清空图谱时删除对应的进度文件
+        if not os.path.isdir(progress_dir):
+            return
+        names = [file_name + '.jsonl'] if file_name else os.listdir(progress_dir)
+        for name in names:
+            path = os.path.join(progress_dir, name)
+            if os.path.isfile(path):
+                os.remove(path)
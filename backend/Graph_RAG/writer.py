@@ -0,0 +1,238 @@
+"""
+    Neo4j 批量写入: 在内存中累计多个分块抽取出的节点与关系并去重, 按标签/关系类型分组,
+    用参数化的 UNWIND 语句成批写入. 写入结果与 graph.add_graph_documents(baseEntityLabel=True, include_source=True) 一致.
+
+    吞吐测试(需要 .env 中配置的 Neo4j, 会写入并删除 source=writer_bench 的数据), 在 backend 目录下运行:
+        python -m Graph_RAG.writer --docs 500
+"""
+import time
+from hashlib import md5
+
+__all__ = (
+    'GraphWriter',
+)
+
+BASE_ENTITY_LABEL = '__Entity__'
+
+
+def _quote(name):
+    # 标签与关系类型不能参数化, 用反引号转义后拼接进语句
+    return '`' + name.replace('`', '') + '`'
+
+
+class GraphWriter:
+    """
+        图谱批量写入器:
+        - add() 累计图文档, 实体按 id 去重, 同一实体的多个类型作为多个标签, 关系按 (起点, 类型, 终点) 去重
+        - 待写入的行数达到 flush_size 时自动 flush()(为 None 时只手动 flush), 结束时需调用 flush() 或使用 with 语句
+        - 每批 batch_size 行在一个事务中写入, 失败时退避重试 retries 次, flush() 返回重试后仍写入失败的行数
+    """
+    def __init__(self, graph, batch_size=1000, retries=3, flush_size=20000):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.retries = retries
+        self.flush_size = flush_size
+        self._reset()
+        self._constraint = False
+        # 统计信息
+        self.written = {'documents': 0, 'nodes': 0, 'relationships': 0, 'mentions': 0}
+        self.transactions = 0
+        self.failed_batches = 0
+        self.write_time = 0.0
+
+    def _reset(self):
+        self.documents = {}  # 文档 id -> {'id', 'text', 'metadata'}
+        self.nodes = {}  # 实体 id -> {'labels': set, 'properties': dict}
+        self.relationships = {}  # (起点 id, 类型, 终点 id) -> 属性
+        self.mentions = set()  # (文档 id, 实体 id)
+
+    @property
+    def pending(self):
+        return len(self.documents) + len(self.nodes) + len(self.relationships) + len(self.mentions)
+
+    def _add_node(self, node):
+        entry = self.nodes.setdefault(str(node.id), {'labels': set(), 'properties': {}})
+        label = (node.type or '').replace('`', '')
+        if label:
+            entry['labels'].add(label)
+        entry['properties'].update(getattr(node, 'properties', None) or {})
+        return str(node.id)
+
+    def add(self, graph_documents):
+        for doc in graph_documents:
+            doc_id = None
+            if doc.source is not None:
+                metadata = doc.source.metadata
+                if not metadata.get('id'):
+                    metadata['id'] = md5(doc.source.page_content.encode('utf-8')).hexdigest()
+                doc_id = metadata['id']
+                self.documents[doc_id] = {'id': doc_id, 'text': doc.source.page_content, 'metadata': dict(metadata)}
+            for node in doc.nodes:
+                node_id = self._add_node(node)
+                if doc_id is not None:
+                    self.mentions.add((doc_id, node_id))
+            for rel in doc.relationships:
+                key = (self._add_node(rel.source), rel.type.replace(' ', '_').replace('`', '').upper(),
+                       self._add_node(rel.target))
+                self.relationships.setdefault(key, {}).update(rel.properties or {})
+        if self.flush_size and self.pending >= self.flush_size:
+            self.flush()
+
+    def _ensure_constraint(self):
+        if not self._constraint:
+            self.graph.query(f'CREATE CONSTRAINT IF NOT EXISTS FOR (b:{BASE_ENTITY_LABEL}) REQUIRE b.id IS UNIQUE')
+            self._constraint = True
+
+    def _write(self, session, query, rows):
+        # 分批写入, 每批一个事务, 返回写入失败的行数
+        def work(tx, batch):
+            tx.run(query, rows=batch).consume()
+
+        failed = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            for i in range(self.retries):
+                try:
+                    session.execute_write(work, batch)
+                    self.transactions += 1
+                    break
+                except Exception as e:
+                    print(f'ERROR: 批量写入失败_{i}!', str(e))
+                    time.sleep(0.5 * 2 ** i)
+            else:
+                self.failed_batches += 1
+                failed += len(batch)
+                print(f'ERROR: 多次重试仍然写入失败, 丢弃 {len(batch)} 行')
+        return failed
+
+    def _queries(self):
+        # 按写入顺序生成 (统计项, 语句, 数据): 文档 -> 实体(按标签分组) -> 关系(按类型分组) -> MENTIONS
+        yield 'documents', (
+            'UNWIND $rows AS row '
+            'MERGE (d:Document {id: row.id}) '
+            'SET d.text = row.text '
+            'SET d += row.metadata'
+        ), list(self.documents.values())
+
+        by_labels = {}
+        for node_id, entry in self.nodes.items():
+            by_labels.setdefault(tuple(sorted(entry['labels'])), []).append(
+                {'id': node_id, 'properties': entry['properties']})
+        for labels, rows in by_labels.items():
+            set_labels = ''.join(f' SET n:{_quote(label)}' for label in labels)
+            yield 'nodes', (
+                'UNWIND $rows AS row '
+                f'MERGE (n:{BASE_ENTITY_LABEL} {{id: row.id}}) '
+                f'SET n += row.properties{set_labels}'
+            ), rows
+
+        by_type = {}
+        for (source, rel_type, target), properties in self.relationships.items():
+            by_type.setdefault(rel_type, []).append({'source': source, 'target': target, 'properties': properties})
+        for rel_type, rows in by_type.items():
+            yield 'relationships', (
+                'UNWIND $rows AS row '
+                f'MATCH (s:{BASE_ENTITY_LABEL} {{id: row.source}}) '
+                f'MATCH (t:{BASE_ENTITY_LABEL} {{id: row.target}}) '
+                f'MERGE (s)-[r:{_quote(rel_type)}]->(t) '
+                'SET r += row.properties'
+            ), rows
+
+        yield 'mentions', (
+            'UNWIND $rows AS row '
+            'MATCH (d:Document {id: row.doc}) '
+            f'MATCH (n:{BASE_ENTITY_LABEL} {{id: row.id}}) '
+            'MERGE (d)-[:MENTIONS]->(n)'
+        ), [{'doc': doc_id, 'id': node_id} for doc_id, node_id in self.mentions]
+
+    def flush(self):
+        # 写入全部待写入的数据, 返回写入失败的行数, 0 表示全部写入成功
+        if not self.pending:
+            return 0
+        self._ensure_constraint()
+        start = time.perf_counter()
+        rows_total = 0
+        failed = 0
+        with self.graph._driver.session(database=self.graph._database) as session:
+            for name, query, rows in self._queries():
+                if rows:
+                    n = self._write(session, query, rows)
+                    failed += n
+                    self.written[name] += len(rows) - n
+                    rows_total += len(rows) - n
+        cost = time.perf_counter() - start
+        self.write_time += cost
+        print(f'~ 图谱写入 {rows_total} 行, 耗时 {cost:.2f}s, {rows_total / cost if cost else 0:.0f} 行/s')
+        self._reset()
+        return failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def stats(self):
+        rows = sum(self.written.values())
+        return {
+            **self.written,
+            'pending': self.pending,
+            'transactions': self.transactions,
+            'failed_batches': self.failed_batches,
+            'rows_per_sec': rows / self.write_time if self.write_time else 0.0,
+        }
+
+
+if __name__ == '__main__':
+    import random
+    import argparse
+    from langchain_core.documents import Document
+    from langchain_neo4j.graphs.graph_document import GraphDocument, Node, Relationship
+    from .base import graph
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=500)
+    parser.add_argument('--nodes', type=int, default=10, help='每个分块的实体数')
+    parser.add_argument('--vocab', type=int, default=2000, help='实体名总数, 越小重复越多')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--baseline', type=int, default=50, help='逐文档 add_graph_documents 的对照文档数')
+    args = parser.parse_args()
+
+    random.seed(0)
+    labels = ['Person', 'Organization', 'Location']
+    rel_types = ['KNOWS', 'MEMBER_OF', 'LOCATED_IN']
+
+    def make_docs(n, tag):
+        docs = []
+        for i in range(n):
+            nodes = [Node(id=f'bench_{random.randrange(args.vocab)}', type=random.choice(labels))
+                     for _ in range(args.nodes)]
+            rels = [Relationship(source=a, target=b, type=random.choice(rel_types))
+                    for a, b in zip(nodes, nodes[1:])]
+            source = Document(f'{tag} chunk {i}', metadata={'source': 'writer_bench'})
+            docs.append(GraphDocument(nodes=nodes, relationships=rels, source=source))
+        return docs
+
+    def clear():
+        graph.query("MATCH (d:Document {source: 'writer_bench'}) DETACH DELETE d")
+        graph.query("MATCH (n:__Entity__) WHERE n.id STARTS WITH 'bench_' DETACH DELETE n")
+
+    clear()
+    try:
+        docs = make_docs(args.baseline, 'baseline')
+        start = time.perf_counter()
+        for doc in docs:
+            graph.add_graph_documents([doc], baseEntityLabel=True, include_source=True)
+        cost = time.perf_counter() - start
+        print(f'add_graph_documents: {args.baseline} 分块 {cost:.2f}s, {args.baseline / cost:.1f} 分块/s')
+        clear()
+
+        docs = make_docs(args.docs, 'writer')
+        start = time.perf_counter()
+        with GraphWriter(graph, batch_size=args.batch_size) as writer:
+            writer.add(docs)
+        cost = time.perf_counter() - start
+        print(f'GraphWriter: {args.docs} 分块 {cost:.2f}s, {args.docs / cost:.1f} 分块/s')
+        print(writer.stats())
+    finally:
+        clear()
@@ -3,6 +3,7 @@ import asyncio
 import logging
 import os
 import sys
+import time
 from .config import mcp_configs
 # Third-party imports
 try:
@@ -16,7 +17,67 @@ except ImportError as e:
     sys.exit(1)
 
 # Local application imports
-from langchain_mcp_tools import convert_mcp_to_langchain_tools
+from .pool import MCPToolPool
+from cache import LRUCache
+
+# 常驻的 MCP 工具池, 由 main.py 在应用启动时 start(), 退出时 stop()
+pool = MCPToolPool(mcp_configs, health_interval=int(os.environ.get('MCP_HEALTH_INTERVAL') or 30),
+                    cache_size=int(os.environ.get('MCP_TOOL_CACHE_SIZE') or 1024))
+
+# 编译好的 ReAct agent, 按 (模型, 工具列表摘要) 缓存; 工具列表变化后摘要改变, 旧条目自然失效
+agents = LRUCache(maxsize=int(os.environ.get('MCP_AGENT_CACHE_SIZE') or 16))
+
+# create_react_agent 中模型与工具节点的名称
+AGENT_NODE = 'agent'
+TOOLS_NODE = 'tools'
+
+# 各阶段耗时: 工具发现, agent 构建, 首个 token
+STAGES = ('tool_discovery', 'graph_build', 'first_token')
+timings = {stage: {'count': 0, 'total': 0.0, 'max': 0.0} for stage in STAGES}
+
+
+def _record(stage, seconds):
+    t = timings[stage]
+    t['count'] += 1
+    t['total'] += seconds
+    t['max'] = max(t['max'], seconds)
+
+
+def _model_key(llm):
+    # 同一模型对象及模型名共用 agent
+    return type(llm).__name__, getattr(llm, 'model_name', None) or getattr(llm, 'model', None), id(llm)
+
+
+def get_agent(llm):
+    start = time.perf_counter()
+    tools = pool.get_tools()  # 复用常驻会话上的工具, 不再每次启动 MCP 服务
+    key = (_model_key(llm), pool.schema_hash)
+    _record('tool_discovery', time.perf_counter() - start)
+
+    agent = agents.get(key)
+    if agent is None:
+        start = time.perf_counter()
+        agent = create_react_agent(
+            llm,
+            tools
+        )  # 创建agent
+        agents.set(key, agent)
+        _record('graph_build', time.perf_counter() - start)
+    return agent
+
+
+def stats():
+    return {
+        'pool': pool.stats(),
+        'schema_hash': pool.schema_hash,
+        'agent_cache': agents.stats(),
+        'timings_ms': {
+            stage: {'count': t['count'], 'avg': t['total'] / t['count'] * 1000 if t['count'] else 0.0,
+                    'max': t['max'] * 1000}
+            for stage, t in timings.items()
+        },
+    }
+
 
 # A very simple logger
 def init_logger() -> logging.Logger: # 初始化
@@ -27,32 +88,46 @@ def init_logger() -> logging.Logger: # 初始化
     )
     return logging.getLogger()
 
+def _text(content):
+    # 消息内容可能是字符串, 也可能是内容块列表, 只取其中的文本
+    if isinstance(content, str):
+        return content
+    return ''.join(block.get('text', '') if isinstance(block, dict) else str(block)
+                   for block in content if not isinstance(block, dict) or block.get('type') == 'text')
+
+
 async def run(llm, messages):  # 运行接口函数
-    try:
-        
-        tools, cleanup = await convert_mcp_to_langchain_tools(
-            mcp_configs,
-            init_logger()
-        )  # 获得工具
-        print(tools)
-        agent = create_react_agent(
-            llm,
-            tools
-        )  # 创建agent
+    """
+        流式运行 agent:
+        - 只转发 agent 节点生成的回答 token(str)
+        - 模型发起工具调用时产出 {'event': 'tool_start', ...}, 工具返回时产出 {'event': 'tool_end', ...},
+          工具的输入参数与返回内容不发送给客户端
+    """
+    if not pool.started:  # 未在应用启动时初始化(如直接运行本文件)
+        await pool.start()
+    start = time.perf_counter()
+    agent = get_agent(llm)
 
-        print('\x1b[33m')  # color to yellow
-        print(messages)
-        print('\x1b[0m')   # reset the color
-        result = agent.invoke({'messages': messages}, stream_mode="messages")
-        # return result
-        async for chunk in result:
-            # print(chunk[0].content, end="", flush=True)
-            res = chunk[0].content
-            if len(res)<=20 and 'INFO' not in res:
+    print('\x1b[33m')  # color to yellow
+    print(messages)
+    print('\x1b[0m')   # reset the color
+    async for message, metadata in agent.astream({'messages': messages}, stream_mode="messages"):
+        node = metadata.get('langgraph_node')
+        if node == AGENT_NODE:
+            # 流式输出时工具调用的第一个片段带有工具名, 之后的片段只是参数; 非流式模型直接给出完整的 tool_calls
+            calls = getattr(message, 'tool_call_chunks', None) or getattr(message, 'tool_calls', None) or ()
+            for call in calls:
+                if call.get('name'):
+                    yield {'event': 'tool_start', 'data': {'id': call.get('id'), 'name': call['name']}}
+            res = _text(message.content)
+            if res:
+                if start is not None:
+                    _record('first_token', time.perf_counter() - start)
+                    start = None
                 yield res
-    finally:
-        if cleanup is not None:
-            await cleanup()
+        elif node == TOOLS_NODE and message.type == 'tool':
+            yield {'event': 'tool_end', 'data': {'id': message.tool_call_id, 'name': message.name,
+                                                 'status': getattr(message, 'status', 'success')}}
 
 
 
@@ -66,6 +141,10 @@ if __name__ == '__main__':
         temperature=0
     )
     async def main():
-        async for res in run(_llm, '学校周围有什么美食'):
-            print(res, end="", flush=True)
+        async for res in run(_llm, [{'role': 'user', 'content': '学校周围有什么美食'}]):
+            if isinstance(res, str):
+                print(res, end="", flush=True)
+            else:
+                print(f"\n[{res['event']}] {res['data']['name']}")
+        await pool.stop()
     asyncio.run(main())
\ No newline at end of file
@@ -1,3 +1,5 @@
+# timeout: 单次工具调用超时(秒); max_concurrency: 同一服务同时执行的工具调用数上限
+# cache_ttl: 工具结果缓存时间(秒), 键为工具名, '*' 为默认值, 0 表示不缓存
 mcp_configs = {
             "zut-mcp": {
                 "timeout": 60,
@@ -8,6 +10,10 @@ mcp_configs = {
                 ],
                 "env":{
                     "GAODE_KEY": "1dc82785a65673e284ca4f272ec9a537"
+                },
+                "max_concurrency": 4,
+                "cache_ttl": {
+                    "*": 300
                 }
             }
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,289 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from mcp import ClientSession, types
+from mcp.client.stdio import stdio_client, StdioServerParameters
+from langchain_core.tools import StructuredTool, ToolException
+from cache import LRUCache
+
+__all__ = (
+    'MCPToolPool',
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MCPServer:
+    """
+        一个常驻的 MCP 服务进程及其会话. 会话在独立的任务中打开与关闭(stdio_client 要求同一任务),
+        同一个会话上可以并发发起多个工具调用.
+    """
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.session = None
+        self.tools = []
+        self.tools_hash = ''  # 工具列表(名称, 描述, 参数 schema)的摘要, 工具变化时随之改变
+        self.restarts = 0
+        self.error = None
+        # 同一服务上同时执行的工具调用数上限
+        self.semaphore = asyncio.Semaphore(config.get('max_concurrency', 4))
+        self.calls = 0
+        self.in_flight = 0
+        self.timeouts = 0
+        self._task = None
+        self._ready = None
+        self._stop = None
+        self._refresh_task = None
+
+    @property
+    def alive(self):
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    def _set_tools(self, tools):
+        self.tools = tools
+        digest = json.dumps([(t.name, t.description, t.inputSchema) for t in tools], ensure_ascii=False, sort_keys=True)
+        self.tools_hash = hashlib.sha1(digest.encode('utf-8')).hexdigest()
+
+    async def refresh_tools(self):
+        # 重新获取工具列表, 返回工具是否发生变化
+        old = self.tools_hash
+        self._set_tools((await self.session.list_tools()).tools)
+        if self.tools_hash != old:
+            print(f'~ MCP 服务工具列表已变化: {self.name}, 工具数: {len(self.tools)}')
+        return self.tools_hash != old
+
+    async def _on_message(self, message):
+        # 服务端通知工具列表变化时刷新; 不能在消息回调中直接等待请求结果, 放到单独的任务中
+        if isinstance(message, types.ServerNotification) and \
+                isinstance(message.root, types.ToolListChangedNotification):
+            # 保留任务引用, 避免任务在完成前被回收; 新的通知到达时旧的刷新已无意义
+            self._cancel_refresh()
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh_tools())
+
+    def _cancel_refresh(self):
+        task, self._refresh_task = self._refresh_task, None
+        if task is not None and not task.done():
+            task.cancel()
+
+    def _params(self):
+        env = dict(os.environ, **self.config.get('env', {}))
+        return StdioServerParameters(command=self.config['command'], args=self.config.get('args', []), env=env)
+
+    async def _serve(self):
+        try:
+            async with stdio_client(self._params()) as (read, write):
+                async with ClientSession(read, write, message_handler=self._on_message) as session:
+                    await session.initialize()
+                    self._set_tools((await session.list_tools()).tools)
+                    self.session = session
+                    self.error = None
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self.error = e
+            logger.error(f'MCP 服务 {self.name} 异常退出: {e}')
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def start(self):
+        if self.config.get('type', 'stdio') != 'stdio':
+            raise ValueError(f'MCP 服务 {self.name}: 暂只支持 stdio 类型')
+        self._ready, self._stop = asyncio.Event(), asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._serve())
+        try:
+            await asyncio.wait_for(self._ready.wait(), self.config.get('timeout', 60))
+            if self.session is None:
+                raise RuntimeError(f'MCP 服务 {self.name} 启动失败: {self.error}')
+        except BaseException:
+            # 启动超时或失败时结束服务任务, 关闭已启动的子进程
+            await self._cancel()
+            raise
+        print(f'~ MCP 服务已启动: {self.name}, 工具数: {len(self.tools)}')
+
+    async def _cancel(self):
+        self._cancel_refresh()
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+
+    async def stop(self):
+        self._cancel_refresh()
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, 10)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        self._task = None
+
+    async def restart(self):
+        self.restarts += 1
+        await self.stop()
+        await self.start()
+
+    async def ping(self):
+        await asyncio.wait_for(self.session.send_ping(), self.config.get('timeout', 60))
+
+    def cache_ttl(self, tool_name):
+        # 工具结果缓存时间(秒), 按工具名配置, '*' 为该服务的默认值, 0 表示不缓存
+        ttl = self.config.get('cache_ttl', {})
+        return ttl.get(tool_name, ttl.get('*', 0))
+
+
+class MCPToolPool:
+    """
+        应用启动时创建的 MCP 工具池:
+        - 每个 MCP 服务只启动一次, 会话常驻, 多个 agent 请求并发复用
+        - 后台定期 ping, 服务进程退出或无响应时自动重启
+        - 服务重启或工具列表变化后 schema_hash 随之变化, 依赖工具的缓存(如 agent)据此失效
+        - 工具调用受每个服务的并发上限与超时约束, 结果按 (工具名, 规范化参数) 缓存, 相同的并发调用只执行一次
+        - 应用退出时关闭全部服务
+    """
+    def __init__(self, configs, health_interval=30, cache_size=1024):
+        self.configs = configs
+        self.health_interval = health_interval
+        self.servers = {name: MCPServer(name, config) for name, config in configs.items()}
+        self._tools = None
+        self._tools_key = None
+        self.cache = LRUCache(maxsize=cache_size)
+        self._pending = {}  # 执行中的调用任务, 相同参数的并发调用共享结果
+        self._health_task = None
+        self._lock = None
+
+    @property
+    def started(self):
+        return self._health_task is not None
+
+    async def start(self):
+        if self.started:
+            return
+        self._lock = asyncio.Lock()
+        for server in self.servers.values():
+            try:
+                await server.start()
+            except Exception as e:
+                print(f'ERROR: MCP 服务 {server.name} 启动失败:', str(e))
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for server in self.servers.values():
+            await server.stop()
+
+    async def _ensure_alive(self, server):
+        # 检查服务是否存活, 不存活时重启
+        async with self._lock:
+            if server.alive:
+                try:
+                    await server.ping()
+                    # 不支持变化通知的服务, 在健康检查时重新获取工具列表
+                    await server.refresh_tools()
+                    return True
+                except Exception as e:
+                    print(f'ERROR: MCP 服务 {server.name} 无响应:', str(e))
+            try:
+                await server.restart()
+                return True
+            except Exception as e:
+                print(f'ERROR: MCP 服务 {server.name} 重启失败:', str(e))
+                return False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for server in self.servers.values():
+                await self._ensure_alive(server)
+
+    async def _call(self, server, tool_name, arguments):
+        if not server.alive and not await self._ensure_alive(server):
+            raise ToolException(f'MCP 服务 {server.name} 不可用')
+        async with server.semaphore:
+            server.calls += 1
+            server.in_flight += 1
+            try:
+                result = await asyncio.wait_for(server.session.call_tool(tool_name, arguments=arguments),
+                                                server.config.get('timeout', 60))
+            except asyncio.TimeoutError:
+                server.timeouts += 1
+                raise ToolException(f'工具 {tool_name} 调用超时')
+            finally:
+                server.in_flight -= 1
+        text = '\n'.join(item.text for item in result.content if getattr(item, 'text', None))
+        if result.isError:
+            raise ToolException(text)
+        return text
+
+    async def call_tool(self, server_name, tool_name, arguments):
+        server = self.servers[server_name]
+        ttl = server.cache_ttl(tool_name)
+        key = (server_name, tool_name, json.dumps(arguments, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+        if ttl:
+            res = self.cache.get(key)
+            if res is not None:
+                return res
+        # 调用在独立的任务中执行, 各调用方通过 shield 等待: 某个调用方被取消(如客户端断开)不影响其他调用方
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._run(key, server, tool_name, arguments, ttl))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # 无等待方时避免未读取异常的警告
+            self._pending[key] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, key, server, tool_name, arguments, ttl):
+        try:
+            res = await self._call(server, tool_name, arguments)
+            if ttl:
+                self.cache.set(key, res, ttl)  # 出错的调用不缓存
+            return res
+        finally:
+            self._pending.pop(key, None)
+
+    def _make_tool(self, server_name, tool):
+        async def call(**kwargs):
+            return await self.call_tool(server_name, tool.name, kwargs)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description or '',
+            args_schema=tool.inputSchema,
+            coroutine=call,
+            handle_tool_error=True,
+        )
+
+    @property
+    def schema_hash(self):
+        # 全部服务工具列表的摘要
+        digest = ''.join(f'{name}:{server.tools_hash};' for name, server in self.servers.items())
+        return hashlib.sha1(digest.encode('utf-8')).hexdigest()
+
+    def get_tools(self):
+        # 转换为 LangChain 工具, 只在工具列表变化后重新生成
+        key = self.schema_hash
+        if self._tools is None or self._tools_key != key:
+            self._tools = [self._make_tool(server.name, tool)
+                           for server in self.servers.values() for tool in server.tools]
+            self._tools_key = key
+        return self._tools
+
+    def stats(self):
+        return {
+            'servers': {
+                name: {'alive': server.alive, 'tools': len(server.tools), 'restarts': server.restarts,
+                       'calls': server.calls, 'in_flight': server.in_flight, 'timeouts': server.timeouts,
+                       'error': str(server.error) if server.error else None}
+                for name, server in self.servers.items()
+            },
+            'cache': self.cache.stats(),
+        }
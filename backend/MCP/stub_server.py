@@ -0,0 +1,32 @@
+"""
+    本地调试用的 MCP 桩服务(stdio), 不依赖外部网络与 API Key.
+    在 config.py 中替换为以下配置即可使用:
+        "stub": {"timeout": 10, "type": "stdio", "command": "python", "args": ["MCP/stub_server.py"]}
+"""
+import asyncio
+from mcp.server.fastmcp import FastMCP
+
+server = FastMCP('stub-mcp')
+
+
+@server.tool()
+def echo(text: str) -> str:
+    """原样返回输入的文本"""
+    return text
+
+
+@server.tool()
+def add(a: float, b: float) -> float:
+    """计算两个数的和"""
+    return a + b
+
+
+@server.tool()
+async def sleep(seconds: float) -> str:
+    """等待指定秒数后返回, 用于测试并发调用"""
+    await asyncio.sleep(seconds)
+    return f'slept {seconds}s'
+
+
+if __name__ == '__main__':
+    server.run()
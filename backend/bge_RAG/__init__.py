@@ -1,26 +1,87 @@
 import os
+import json
+import pickle
+import shutil
+import hashlib
 import dotenv
+from collections import deque
 dotenv.load_dotenv()
 from .retriever import Retriever
 from .reranker import Reranker
 
+SNAPSHOT_VERSION = 3  # 知识库快照格式版本, 格式变化时递增
+KB_EXTENSIONS = ('.txt', '.pdf')  # 知识库支持的文件类型
+PDF_ADD_BATCH = 256  # PDF 边解析边入库, 每累计这么多 chunk 编码并写入一次
+
+
+def file_hash(file_path):
+    # 计算文件内容哈希, 用于判断文件是否需要重新编码
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
 class RAG():
     def __init__(self, max_len=256, overlap_len=100):
         # 初始化函数
-        self.retriever = Retriever(emb_model_name_or_path=os.environ['emb_model_name_or_path'])
-        self.reranker = Reranker(rerank_model_name_or_path=os.environ['rerank_model_name_or_path'])
+        # 送入重排的候选数量上限, 未设置时保留全部融合结果
+        candidate_top_n = os.environ.get('RAG_CANDIDATES', '').strip()
+        self.retriever = Retriever(emb_model_name_or_path=os.environ['emb_model_name_or_path'],
+                                   fusion=os.environ.get('RAG_FUSION', '').strip() or 'rrf',
+                                   candidate_top_n=int(candidate_top_n) if candidate_top_n else None)
+        early_exit_gap = os.environ.get('RERANK_EARLY_EXIT_GAP', '').strip()
+        self.reranker = Reranker(rerank_model_name_or_path=os.environ['rerank_model_name_or_path'],
+                                 batch_size=int(os.environ.get('RERANK_BATCH_SIZE') or 16),
+                                 cache_size=int(os.environ.get('RERANK_CACHE_SIZE') or 20000),
+                                 early_exit_gap=float(early_exit_gap) if early_exit_gap else None)
         self.max_len = int(max_len)
         self.overlap_len = int(overlap_len)
-    def _add(self, corpus):
+        self.file_hashes = {}  # 来源文件 -> 内容哈希
+        self.version = 0  # 知识库版本, 每次增删文件后递增, 用于判断缓存是否过期
+        self.snapshot_dir = os.environ.get('KB_SNAPSHOT_DIR', 'kb_snapshot')
+    def _add(self, corpus, source=None):
         # 私有添加函数
-        self.retriever.add(corpus)
+        self.retriever.add(corpus, source=source)
         
     def req(self, query, top_k=5):
         # 查询函数
         retrieval_res = self.retriever.retrieval(query)  # 获得初步查询
-        rerank_res = self.reranker.rerank(retrieval_res, query, k=top_k)  # 后处理, 精排
-        return '\n<document-spilt>\n'.join(rerank_res)
+        if not retrieval_res:
+            return ''
+        rerank_res = self.reranker.rerank(retrieval_res, query, k=top_k, return_docs=True)  # 后处理, 精排
+        return self._cite(rerank_res)
     
+    async def areq(self, query, top_k=5, embed=None, score=None, run=None, query_embedding=None):
+        """
+            异步查询, 编码与重排打分交给外部的批处理调度器, 与其他请求合并为一批执行
+        Args:
+            embed: 异步函数 query -> 查询向量
+            score: 异步函数 list[(query, doc)] -> list[得分]
+            run: 异步函数 run(fn, *args, **kwargs), 在线程池中执行同步的检索
+            query_embedding: 已计算好的查询向量, 提供时不再调用 embed
+        """
+        if query_embedding is None:
+            query_embedding = await embed(query)
+        retrieval_res = await run(self.retriever.retrieval, query, query_embedding=query_embedding)
+        if not retrieval_res:
+            return ''
+        rerank_res = await self.reranker.arerank(retrieval_res, query, k=top_k, score=score, return_docs=True)
+        return self._cite(rerank_res)
+
+    @staticmethod
+    def _cite(docs):
+        # 带页码的 chunk(来自 PDF) 前加上来源文件与页码, 便于回答时引用
+        res = []
+        for doc in docs:
+            text, meta = doc.page_content, doc.metadata
+            if 'page' in meta:
+                pages = meta['page'] if meta['page'] == meta['page_end'] else f"{meta['page']}-{meta['page_end']}"
+                text = f"[{meta['source']} 第 {pages} 页]\n{text}"
+            res.append(text)
+        return '\n<document-spilt>\n'.join(res)
+
     def spilt(self, page_content):
         # 分隔函数
         cleaned_chunks = []
@@ -34,40 +95,211 @@ class RAG():
                 cleaned_chunks.append(cur_s)
             i += (self.max_len - self.overlap_len)
         return cleaned_chunks
-    def add(self, save_path=None):
-        spiltNum = self.max_len
-        chunk_overlap = self.overlap_len
+    def _chunk_spans(self, pieces):
+        """
+            流式切分: 依次读入文本片段, 按 max_len 大小, overlap_len 重叠的窗口产出 (chunk, 起始偏移, 结束偏移),
+            偏移为 chunk 在全部片段拼接后的文本中的位置,
+            chunk 与 CharacterTextSplitter(separator="", chunk_size=max_len, chunk_overlap=overlap_len) 的结果一致
+        """
+        size, step = self.max_len, self.max_len - self.overlap_len
+        buf = ''
+        offset = 0  # buf[0] 在全文中的位置
+        emitted = False
+
+        def span(window, start):
+            chunk = window.strip()
+            start += len(window) - len(window.lstrip())
+            return chunk, start, start + len(chunk)
+
+        for piece in pieces:
+            buf += piece
+            start = 0
+            while len(buf) - start > size:
+                chunk, s, e = span(buf[start:start + size], offset + start)
+                if chunk:
+                    yield chunk, s, e
+                start += step
+                emitted = True
+            buf = buf[start:]
+            offset += start
+        chunk, s, e = span(buf, offset)
+        if chunk and (not emitted or len(buf) > self.overlap_len):
+            yield chunk, s, e
+
+    def _chunk_stream(self, pieces):
+        for chunk, _, _ in self._chunk_spans(pieces):
+            yield chunk
+
+    def _chunk_pages(self, pages):
+        """
+            按页流式切分, pages 为 (页码, 文本) 的迭代器, 产出 (chunk, {'page': 起始页, 'page_end': 结束页})
+        """
+        starts = deque()  # (页在全文中的起始偏移, 页码), 只保留当前窗口可能涉及的页
+
+        def pieces():
+            pos = 0
+            for page, text in pages:
+                starts.append((pos, page))
+                text += '\n'
+                pos += len(text)
+                yield text
+
+        for chunk, start, end in self._chunk_spans(pieces()):
+            while len(starts) > 1 and starts[1][0] <= start:
+                starts.popleft()
+            last = starts[0][1]
+            for pos, page in starts:
+                if pos >= end:
+                    break
+                last = page
+            yield chunk, {'page': starts[0][1], 'page_end': last}
+
+    def _read_chunks(self, file_path):
+        # 逐行读取单个文件并切分为 chunk, 不一次性读入整个文件
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return list(self._chunk_stream(f))
+
+    def _add_pdf(self, file_path, source, reuse, progress=None):
+        """
+            PDF 入库: 进程池并行解析各页, 解析出的页文本直接送入切分与编码, 每 PDF_ADD_BATCH 个 chunk 写入一次,
+            不在内存中保存整个文档; chunk 的页码作为元信息保存
+        """
+        from read_pdf import Reader
+        reader = Reader(file_path)
+        print(f'~ 正在添加进知识库: {source}, {reader.num_pages} 页')
+        corpus, metadata, done = [], [], 0
+
+        def flush():
+            nonlocal done
+            self.retriever.add(corpus, source=source, reuse=reuse, metadata=metadata)
+            done += len(corpus)
+            if progress is not None:
+                # 总数未知, 按已解析的页数比例估算
+                progress(done, max(done, round(done * reader.num_pages / metadata[-1]['page_end'])))
+            corpus.clear()
+            metadata.clear()
+
+        for chunk, meta in self._chunk_pages(reader.iter_pages()):
+            corpus.append(chunk)
+            metadata.append(meta)
+            if len(corpus) >= PDF_ADD_BATCH:
+                flush()
+        if corpus:
+            flush()
+        print(f'~ 已添加: {source}, {done} 条')
+
+    def _add_file(self, file_path, progress=None):
+        # 按文件增量添加, 已存在的同名文件先删除旧的 chunk, 未变化的 chunk 复用旧向量; progress(已编码数, 总数)
+        source = os.path.basename(file_path)
+        reuse = self.retriever.vectors_of(source)
+        self.retriever.remove(source)
+        try:
+            if source.lower().endswith('.pdf'):
+                self._add_pdf(file_path, source, reuse, progress=progress)
+            else:
+                corpus = self._read_chunks(file_path)
+                print(f'~ 正在添加进知识库: {source}, {len(corpus)} 条')
+                self.retriever.add(corpus, source=source, reuse=reuse, progress=progress)
+        except Exception:
+            # PDF 分批写入, 中途失败时删除已写入的部分, 不在索引中留下只有前几页的文件
+            self.retriever.remove(source)
+            self.file_hashes.pop(source, None)
+            raise
+        finally:
+            self.version += 1
+        self.file_hashes[source] = file_hash(file_path)
+
+    def add(self, save_path=None, progress=None):
         # 开发的添加函数
+        if save_path is not None:
+            # 只索引新上传的文件
+            self._add_file(save_path, progress=progress)
+            print('~ 添加成功')
+            return
+        # 未指定文件时, 同步 UPLOAD_DIR 中尚未索引的文件
         upload_file_path = os.environ['UPLOAD_DIR']
         print('~ 正在读取文本')
-        corpus = []
+        cnt = 0
         for file in os.listdir(upload_file_path):  # 循环添加
-            # print(file, end='\t')
-            if file.endswith('.txt'):
-                with open(os.path.join(upload_file_path, file), 'r', encoding='utf-8') as f:
-                    text = f.read()
-                from langchain.text_splitter import CharacterTextSplitter
-                text_splitter = CharacterTextSplitter(
-                    separator="",      # 按换行分割（可自定义）
-                    chunk_size=spiltNum,      # 每个分片最大字符数
-                    chunk_overlap=chunk_overlap     # 分片之间的重叠字符数
-                )
-                corpus = corpus + text_splitter.split_text(text)
-        print('~ 添加了: ', len(os.listdir(upload_file_path)), ' 条数据')
-        print('~ 正在添加进知识库')
-        if  len(corpus) > 0:
-            self._add(corpus)
+            if file.lower().endswith(KB_EXTENSIONS) and file not in self.retriever.source_to_ids:
+                self._add_file(os.path.join(upload_file_path, file))
+                cnt += 1
+        print('~ 添加了: ', cnt, ' 个文件')
         print('~ 添加成功')
-    
-    def delete(self, *args, **kwargs):
-        # 从知识库中删除
-        self.add(*args, **kwargs)
-        
-    def save(self, *args, **kwargs):
-        # 保存
-        # TODO
-        pass
-    
-    def load(self, *args, **kwargs):
-        # 加载知识库内容
-        self.add()
+
+    def delete(self, file_path):
+        # 从知识库中删除该文件的全部 chunk, 不重建整个知识库
+        source = os.path.basename(file_path)
+        cnt = self.retriever.remove(source)
+        self.file_hashes.pop(source, None)
+        self.version += 1
+        print(f'~ 删除了: {source}, {cnt} 条')
+
+    def _meta(self):
+        # 快照元信息, 编码模型(含推理后端与量化方式)或切分参数不一致时拒绝加载
+        return {
+            'version': SNAPSHOT_VERSION,
+            'emb_model_name_or_path': self.retriever.emb_model_name_or_path,
+            'emb_backend': self.retriever.emb_model.backend,
+            'emb_quantize': self.retriever.emb_model.quantize,
+            'vector_dim': self.retriever.vector_dim,
+            'lan': self.retriever.lan,
+            'max_len': self.max_len,
+            'overlap_len': self.overlap_len,
+        }
+
+    def save(self, path=None):
+        # 保存知识库快照, 先写临时目录再替换, 避免中途失败损坏旧快照
+        path = path or self.snapshot_dir
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        self.retriever.save(tmp_path)
+        meta = dict(self._meta(), files=self.file_hashes)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        if os.path.exists(path):
+            old_path = path + '.old'
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.replace(tmp_path, path)
+        print(f'~ 知识库已保存: {path}')
+
+    def _load_snapshot(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        expected = self._meta()
+        for key, value in expected.items():
+            if meta.get(key) != value:
+                raise ValueError(f'快照参数不匹配: {key}={meta.get(key)!r}, 当前为 {value!r}')
+        self.retriever.load(path)
+        self.file_hashes = dict(meta['files'])
+
+    def load(self, path=None):
+        # 加载知识库快照, 只重新编码内容哈希变化的文件
+        path = path or self.snapshot_dir
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            try:
+                self._load_snapshot(path)
+                print(f'~ 已加载知识库快照: {path}, {len(self.retriever)} 条')
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError, ValueError) as e:
+                # 参数不匹配, 或快照文件缺失/损坏: 丢弃可能只加载了一部分的索引, 重新编码全部文件
+                print('~ 忽略知识库快照:', repr(e))
+                self.retriever.reset()
+                self.file_hashes = {}
+        upload_file_path = os.environ['UPLOAD_DIR']
+        on_disk = {file for file in os.listdir(upload_file_path) if file.lower().endswith(KB_EXTENSIONS)}
+        changed = False
+        for source in list(self.file_hashes):
+            if source not in on_disk:  # 文件已被删除
+                self.delete(source)
+                changed = True
+        for file in sorted(on_disk):
+            file_path = os.path.join(upload_file_path, file)
+            if self.file_hashes.get(file) != file_hash(file_path):  # 新文件或内容变化
+                self._add_file(file_path)
+                changed = True
+        if changed:
+            self.save(path)
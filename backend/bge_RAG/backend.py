@@ -0,0 +1,112 @@
+"""
+    编码模型与重排模型的推理后端:
+    - torch: GPU 上使用 fp16, CPU 上使用 fp32, 可选动态 int8 量化
+    - onnx: 通过 optimum 导出为 ONNX 并使用 ONNX Runtime 推理, 可选动态 int8 量化
+
+    未显式传参时从环境变量读取:
+        RAG_DEVICE      cuda / cpu, 默认有 GPU 时使用 cuda
+        RAG_BACKEND     torch / onnx, 默认 torch
+        RAG_QUANTIZE    1 表示使用动态 int8 量化(仅 CPU)
+        RAG_NUM_THREADS CPU 推理线程数
+        ONNX_CACHE_DIR  ONNX 模型导出目录, 默认 onnx_models
+"""
+import os
+import torch
+from transformers import AutoModel, AutoModelForSequenceClassification
+
+__all__ = (
+    'resolve_device',
+    'resolve_options',
+    'load_model',
+)
+
+BACKENDS = ('torch', 'onnx')
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def resolve_device(device=None):
+    # 解析推理设备, 没有 GPU 时自动回退到 CPU
+    device = device or os.environ.get('RAG_DEVICE', '').strip()
+    if not device:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return device
+
+
+def resolve_options(device=None, backend=None, quantize=None, num_threads=None):
+    # 解析推理选项, 未显式传参时从环境变量读取; 返回 (device, backend, quantize, num_threads)
+    device = resolve_device(device)
+    backend = (backend or os.environ.get('RAG_BACKEND', '').strip() or 'torch').lower()
+    if backend not in BACKENDS:
+        raise ValueError(f'不支持的推理后端: {backend}, 可选: {BACKENDS}')
+    if quantize is None:
+        quantize = _env_flag('RAG_QUANTIZE')
+    if quantize and device.startswith('cuda'):
+        raise ValueError('动态 int8 量化只支持 CPU 推理, 请设置 RAG_DEVICE=cpu')
+    if num_threads is None and os.environ.get('RAG_NUM_THREADS'):
+        num_threads = int(os.environ['RAG_NUM_THREADS'])
+    return device, backend, quantize, num_threads
+
+
+def _load_torch(model_name_or_path, task, device, quantize):
+    if task == 'embedding':
+        model = AutoModel.from_pretrained(model_name_or_path, trust_remote_code=True)
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(model_name_or_path)
+    if device.startswith('cuda'):
+        model = model.half()
+    elif quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model.to(device).eval()
+
+
+def _load_onnx(model_name_or_path, task, device, quantize, num_threads):
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import (ORTModelForFeatureExtraction, ORTModelForSequenceClassification,
+                                         ORTQuantizer)
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise ImportError(f'使用 onnx 后端需要安装 optimum[onnxruntime]: {e}')
+
+    model_cls = ORTModelForFeatureExtraction if task == 'embedding' else ORTModelForSequenceClassification
+    export_dir = os.path.join(os.environ.get('ONNX_CACHE_DIR', 'onnx_models'),
+                              os.path.basename(os.path.normpath(model_name_or_path)))
+    if not os.path.exists(os.path.join(export_dir, 'model.onnx')):
+        print(f'~ 正在导出 ONNX 模型: {export_dir}')
+        model_cls.from_pretrained(model_name_or_path, export=True).save_pretrained(export_dir)
+
+    file_name = 'model.onnx'
+    if quantize:
+        file_name = 'model_quantized.onnx'
+        if not os.path.exists(os.path.join(export_dir, file_name)):
+            print(f'~ 正在量化 ONNX 模型: {export_dir}')
+            quantizer = ORTQuantizer.from_pretrained(export_dir)
+            qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=export_dir, quantization_config=qconfig)
+
+    session_options = onnxruntime.SessionOptions()
+    if num_threads:
+        session_options.intra_op_num_threads = num_threads
+    provider = 'CUDAExecutionProvider' if device.startswith('cuda') else 'CPUExecutionProvider'
+    return model_cls.from_pretrained(export_dir, file_name=file_name, provider=provider,
+                                     session_options=session_options)
+
+
+def load_model(model_name_or_path, task='embedding', device=None, backend=None, quantize=None, num_threads=None):
+    """
+        加载编码模型(task='embedding')或重排模型(task='rerank')
+    Returns:
+        (model, device): model(**inputs) 的输出与 transformers 模型一致
+    """
+    device, backend, quantize, num_threads = resolve_options(device, backend, quantize, num_threads)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if backend == 'onnx':
+        model = _load_onnx(model_name_or_path, task, device, quantize, num_threads)
+    else:
+        model = _load_torch(model_name_or_path, task, device, quantize)
+    print(f'~ 推理后端: {backend}, 设备: {device}, int8: {bool(quantize)}, 线程数: {num_threads or "默认"}')
+    return model, device
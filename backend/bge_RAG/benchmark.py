@@ -0,0 +1,116 @@
+"""
+    bge_RAG 性能测试脚本, 在 backend 目录下运行:
+        python -m bge_RAG.benchmark backend --device cpu --threads 8
+        python -m bge_RAG.benchmark bm25 --docs 200000
+"""
+import os
+import time
+import argparse
+import numpy as np
+import dotenv
+dotenv.load_dotenv()
+
+QUERIES = ['怎样加热座椅？', '座椅加热怎么打开', '如何调节后视镜', '车辆保养周期是多久', '胎压报警怎么处理']
+
+
+def _percentile(costs, q):
+    return float(np.percentile(np.asarray(costs) * 1000, q))
+
+
+def _report(name, costs):
+    print(f'{name:<36} p50={_percentile(costs, 50):8.2f}ms  p99={_percentile(costs, 99):8.2f}ms  n={len(costs)}')
+
+
+def _timeit(fn, runs, warmup=3):
+    for i in range(warmup):
+        fn(i)
+    costs = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def bench_backend(args):
+    # 对比不同推理后端下单条查询编码与重排 20 个候选的延迟
+    from .retriever import TextEmbedding
+    from .reranker import Reranker
+    emb_path = os.environ['emb_model_name_or_path']
+    rerank_path = os.environ['rerank_model_name_or_path']
+    docs = [f'{QUERIES[i % len(QUERIES)]}{i}' * 20 for i in range(20)]
+    for backend, quantize in [('torch', False), ('torch', True), ('onnx', False), ('onnx', True)]:
+        if quantize and args.device.startswith('cuda'):
+            continue
+        name = f'{backend}{"-int8" if quantize else ""}'
+        try:
+            emb = TextEmbedding(emb_path, device=args.device, backend=backend, quantize=quantize,
+                                num_threads=args.threads)
+            reranker = Reranker(rerank_path, device=args.device, backend=backend, quantize=quantize,
+                                num_threads=args.threads)
+        except ImportError as e:
+            print(f'~ 跳过 {name}: {e}')
+            continue
+        _report(f'{os.path.basename(emb_path)} [{name}] embed_query',
+                _timeit(lambda i: emb.embed_query(QUERIES[i % len(QUERIES)]), args.runs))
+        _report(f'{os.path.basename(rerank_path)} [{name}] rerank@20',
+                _timeit(lambda i: reranker.rerank(docs, QUERIES[i % len(QUERIES)]), args.runs))
+
+
+def bench_bm25(args):
+    # 对比 rank_bm25.BM25Okapi 与倒排索引 BM25 的构建耗时与单条查询延迟
+    import jieba
+    from rank_bm25 import BM25Okapi
+    from .bm25 import BM25
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        text = f.read()
+    step = 256 - 100
+    chunks = [text[i:i + 256] for i in range(0, len(text), step)]
+    tokenized = [jieba.lcut(c) for c in chunks]
+    tokenized = [tokenized[i % len(tokenized)] for i in range(args.docs)]
+    queries = [jieba.lcut(q) for q in ['乔峰在聚贤庄大战群雄', '段誉学会了凌波微步', '虚竹破解珍珑棋局',
+                                       '慕容复想要复兴大燕', '阿朱假扮段正淳']]
+    print(f'~ 语料: {args.corpus}, 文档数: {len(tokenized)}')
+
+    start = time.perf_counter()
+    okapi = BM25Okapi(tokenized)
+    print(f'BM25Okapi build: {time.perf_counter() - start:.2f}s')
+    start = time.perf_counter()
+    bm25 = BM25()
+    for i, tokens in enumerate(tokenized):
+        bm25.add(i, tokens)
+    print(f'BM25 build: {time.perf_counter() - start:.2f}s')
+
+    ids = list(range(len(tokenized)))
+    _report('BM25Okapi.get_top_n', _timeit(lambda i: okapi.get_top_n(queries[i % len(queries)], ids, n=10),
+                                           args.runs, warmup=1))
+    _report('BM25.top_k', _timeit(lambda i: bm25.top_k(queries[i % len(queries)], 10), args.runs))
+
+    # 检查两者排序结果是否一致
+    query = queries[0]
+    expected = okapi.get_top_n(query, ids, n=10)
+    got = [idx for idx, _ in bm25.top_k(query, 10)]
+    okapi_scores = okapi.get_scores(query)
+    same = np.allclose(okapi_scores[expected], okapi_scores[got], rtol=1e-4)
+    print(f'~ top10 得分一致: {same}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bge_RAG benchmark')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('backend', help='推理后端单条查询延迟')
+    p.add_argument('--device', default='cpu')
+    p.add_argument('--threads', type=int, default=None)
+    p.add_argument('--runs', type=int, default=50)
+    p.set_defaults(func=bench_backend)
+    p = sub.add_parser('bm25', help='BM25 构建与查询延迟')
+    p.add_argument('--corpus', default=os.path.join(os.path.dirname(__file__), '..', 'Graph_RAG', '天龙八部.txt'))
+    p.add_argument('--docs', type=int, default=200000)
+    p.add_argument('--runs', type=int, default=20)
+    p.set_defaults(func=bench_bm25)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
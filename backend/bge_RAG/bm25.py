@@ -0,0 +1,144 @@
+from array import array
+from collections import Counter
+import numpy as np
+
+__all__ = (
+    'BM25',
+)
+
+
+class BM25:
+    """
+        基于倒排索引的 BM25(Okapi) 检索, 打分公式与 rank_bm25.BM25Okapi 一致:
+        - 每个词的倒排表为 (文档 id 数组, 词频数组), 查询时只计算包含查询词的文档
+        - IDF 与文档长度归一项预先计算, 语料变化后在下一次查询时惰性更新
+        - 支持按递增的文档 id 增量添加, 以及按 id 删除, top-k 使用 argpartition, 不对全部文档排序
+    """
+    def __init__(self, k1=1.5, b=0.75, epsilon=0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        self.vocab = {}  # 词 -> 词 id
+        self._postings = []  # 词 id -> (array 文档 id, array 词频), 追加写
+        self._frozen = {}  # 词 id -> (np 文档 id, np 词频), 过滤掉已删除文档后的查询缓存
+        self.df = array('q')  # 词 id -> 文档频率
+        self.doc_len = array('f')  # 文档 id -> 文档长度, 未使用或已删除的 id 为 0
+        self.alive = bytearray()  # 文档 id -> 是否存在
+        self._doc_terms = {}  # 文档 id -> 该文档包含的词 id, 删除时使用
+        self.n_docs = 0
+        self.total_len = 0
+
+        self._idf = None
+        self._norm = None
+
+    def __len__(self):
+        return self.n_docs
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_frozen'], state['_idf'], state['_norm'] = {}, None, None
+        return state
+
+    def _grow(self, doc_id):
+        n = doc_id + 1 - len(self.doc_len)
+        self.doc_len.extend([0.0] * n)
+        self.alive.extend(b'\x00' * n)
+
+    def add(self, doc_id, tokens):
+        # 添加一篇已分词的文档, 文档 id 必须递增, 删除后的 id 不可复用
+        if doc_id < len(self.doc_len):
+            raise ValueError(f'文档 id 必须递增: {doc_id}')
+        self._grow(doc_id)
+        counts = Counter(tokens)
+        term_ids = []
+        for term, tf in counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = len(self._postings)
+                self.vocab[term] = term_id
+                self._postings.append((array('q'), array('f')))
+                self.df.append(0)
+            ids, tfs = self._postings[term_id]
+            ids.append(doc_id)
+            tfs.append(tf)
+            self.df[term_id] += 1
+            self._frozen.pop(term_id, None)
+            term_ids.append(term_id)
+        self._doc_terms[doc_id] = array('q', term_ids)
+        self.doc_len[doc_id] = len(tokens)
+        self.alive[doc_id] = 1
+        self.n_docs += 1
+        self.total_len += len(tokens)
+        self._idf = self._norm = None
+
+    def remove(self, doc_ids):
+        # 删除文档, 倒排表中的记录在下一次查询该词时过滤
+        for doc_id in doc_ids:
+            if doc_id >= len(self.alive) or not self.alive[doc_id]:
+                continue
+            for term_id in self._doc_terms.pop(doc_id):
+                self.df[term_id] -= 1
+                self._frozen.pop(term_id, None)
+            self.alive[doc_id] = 0
+            self.n_docs -= 1
+            self.total_len -= int(self.doc_len[doc_id])
+            self.doc_len[doc_id] = 0
+        self._idf = self._norm = None
+
+    def _prepare(self):
+        if self._idf is None:
+            df = np.frombuffer(self.df, dtype=np.int64).astype(np.float64)
+            idf = np.log(self.n_docs - df + 0.5) - np.log(df + 0.5)
+            used = df > 0
+            if used.any():
+                # 与 BM25Okapi 一致: 负的 idf 替换为 epsilon * 平均 idf
+                average_idf = idf[used].mean()
+                idf[idf < 0] = self.epsilon * average_idf
+            self._idf = idf.astype(np.float32)
+        if self._norm is None:
+            avgdl = self.total_len / max(self.n_docs, 1)
+            doc_len = np.frombuffer(self.doc_len, dtype=np.float32)
+            self._norm = (self.k1 * (1 - self.b + self.b * doc_len / max(avgdl, 1e-6))).astype(np.float32)
+
+    def _posting(self, term_id):
+        frozen = self._frozen.get(term_id)
+        if frozen is None:
+            ids, tfs = self._postings[term_id]
+            ids = np.frombuffer(ids, dtype=np.int64).copy()
+            tfs = np.frombuffer(tfs, dtype=np.float32).copy()
+            mask = np.frombuffer(self.alive, dtype=np.uint8)[ids].astype(bool)
+            if not mask.all():
+                # 顺便压缩倒排表, 丢弃已删除文档的记录
+                ids, tfs = ids[mask], tfs[mask]
+                self._postings[term_id] = (array('q', ids.tolist()), array('f', tfs.tolist()))
+            frozen = self._frozen[term_id] = (ids, tfs)
+        return frozen
+
+    def get_scores(self, query):
+        """
+            计算已分词查询对所有文档 id 的得分, 返回长度为 len(doc_len) 的数组
+        """
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        if self.n_docs == 0:
+            return scores
+        self._prepare()
+        # 重复的查询词与 BM25Okapi 一样重复计分
+        for term, weight in Counter(query).items():
+            term_id = self.vocab.get(term)
+            if term_id is None or self.df[term_id] == 0:
+                continue
+            ids, tfs = self._posting(term_id)
+            scores[ids] += weight * self._idf[term_id] * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+    def top_k(self, query, k=10):
+        """
+            返回得分最高的 k 篇文档 [(文档 id, 得分)], 不包含得分为 0 的文档
+        """
+        scores = self.get_scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(i), float(scores[i])) for i in candidates]
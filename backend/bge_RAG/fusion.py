@@ -0,0 +1,74 @@
+import hashlib
+
+__all__ = (
+    'reciprocal_rank_fusion',
+    'weighted_fusion',
+    'fuse',
+)
+
+
+def reciprocal_rank_fusion(results, weights=None, k=60):
+    """
+        RRF: score(d) = sum_i w_i / (k + rank_i(d)), 只依赖名次, 不受各检索器得分尺度影响
+    Args:
+        results: {检索器名: [(chunk id, 得分), ...]}, 每个列表按得分降序
+        weights: {检索器名: 权重}, 默认均为 1
+        k: 平滑常数
+    Returns:
+        {chunk id: 融合得分}
+    """
+    weights = weights or {}
+    fused = {}
+    for name, hits in results.items():
+        w = weights.get(name, 1.0)
+        for rank, (idx, _) in enumerate(hits):
+            fused[idx] = fused.get(idx, 0.0) + w / (k + rank + 1)
+    return fused
+
+
+def weighted_fusion(results, weights=None):
+    """
+        加权 min-max 融合: 各检索器得分先归一化到 [0, 1], 再按权重求和
+    """
+    weights = weights or {}
+    fused = {}
+    for name, hits in results.items():
+        if not hits:
+            continue
+        w = weights.get(name, 1.0)
+        scores = [score for _, score in hits]
+        low, high = min(scores), max(scores)
+        span = high - low
+        for idx, score in hits:
+            norm = (score - low) / span if span > 0 else 1.0
+            fused[idx] = fused.get(idx, 0.0) + w * norm
+    return fused
+
+
+def fuse(results, texts, method='rrf', weights=None, rrf_k=60, top_n=None):
+    """
+        融合多路检索结果, 按文本哈希去重, 返回按融合得分降序的 [(chunk id, 融合得分)]
+    Args:
+        results: {检索器名: [(chunk id, 得分), ...]}
+        texts: chunk id -> 文本, 用于去重不同文件中完全相同的 chunk
+        method: 'rrf' 或 'weighted'
+        top_n: 只保留前 top_n 个候选, None 表示全部保留
+    """
+    if method == 'rrf':
+        fused = reciprocal_rank_fusion(results, weights, k=rrf_k)
+    elif method == 'weighted':
+        fused = weighted_fusion(results, weights)
+    else:
+        raise ValueError(f'不支持的融合方式: {method}')
+    ranked = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+    seen = set()
+    res = []
+    for idx, score in ranked:
+        digest = hashlib.md5(texts[idx].encode('utf-8')).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        res.append((idx, score))
+        if top_n is not None and len(res) >= top_n:
+            break
+    return res
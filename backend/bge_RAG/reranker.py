@@ -1,32 +1,126 @@
+import hashlib
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoTokenizer
+from cache import LRUCache
+from .backend import load_model
 
 class Reranker:
-    def __init__(self, rerank_model_name_or_path, device='cuda'):
+    def __init__(self, rerank_model_name_or_path, device=None, backend=None, quantize=None, num_threads=None,
+                 batch_size=16, max_length=512, cache_size=20000, early_exit_gap=None):
         self.rerank_tokenizer = AutoTokenizer.from_pretrained(rerank_model_name_or_path)
-        self.rerank_model = AutoModelForSequenceClassification.from_pretrained(rerank_model_name_or_path)\
-            .half().to(device).eval()
-        self.device = device
+        # device / backend / quantize / num_threads 为 None 时从环境变量读取, 见 backend.py
+        self.rerank_model, self.device = load_model(rerank_model_name_or_path, task='rerank', device=device,
+                                                    backend=backend, quantize=quantize, num_threads=num_threads)
+        self.batch_size = batch_size  # 每批 (query, doc) 对数
+        self.max_length = max_length
+        # (规范化 query, chunk id) -> 得分, 多轮对话中重复出现的候选无需重新打分
+        self.cache = LRUCache(maxsize=cache_size)
+        # 融合得分第 k 名与第 k+1 名的相对差距超过该值时跳过重排, None 表示不跳过
+        self.early_exit_gap = early_exit_gap
+        self.early_exits = 0
         print('successful load rerank model')
 
-    def rerank(self, docs, query, k=5):
-        docs_ = []
+    @staticmethod
+    def _normalize_query(query):
+        return ' '.join(query.split()).lower()
+
+    @staticmethod
+    def _doc_key(item, text):
+        # 优先使用检索结果中的 chunk id, 否则使用文本哈希
+        metadata = getattr(item, 'metadata', None) or {}
+        if 'id' in metadata:
+            return metadata['id']
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+    def score_pairs(self, pairs):
+        """
+            计算 (query, doc) 对的得分. 按 token 长度排序后分批, 同一批长度接近, 减少 padding;
+            超长时只截断 doc, 保证 query 完整.
+        """
+        if not pairs:
+            return []
+        encoded = self.rerank_tokenizer(pairs, truncation='only_second', max_length=self.max_length)
+        order = sorted(range(len(pairs)), key=lambda i: len(encoded['input_ids'][i]))
+        scores = [0.0] * len(pairs)
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            batch = {key: [encoded[key][i] for i in indices] for key in encoded.keys()}
+            with torch.no_grad():
+                inputs = self.rerank_tokenizer.pad(batch, padding=True, return_tensors='pt').to(self.device)
+                logits = self.rerank_model(**inputs, return_dict=True).logits.view(-1, ).float().cpu().tolist()
+            for i, score in zip(indices, logits):
+                scores[i] = score
+        return scores
+
+    def _candidates(self, docs):
+        # 按文本去重, 保留检索顺序
+        candidates = {}
         for item in docs:
-            if isinstance(item, str):
-                docs_.append(item)
-            else:
-                docs_.append(item.page_content)
-        docs = list(set(docs_))
-        pairs = []
-        for d in docs:
-            pairs.append([query, d])
-        with torch.no_grad():
-            inputs = self.rerank_tokenizer(pairs, padding=True, truncation=True, return_tensors='pt', max_length=512)\
-                .to(self.device)
-            scores = self.rerank_model(**inputs, return_dict=True).logits.view(-1, ).float().cpu().tolist()
-        docs = [(docs[i], scores[i]) for i in range(len(docs))]
+            text = item if isinstance(item, str) else item.page_content
+            if text not in candidates:
+                candidates[text] = item
+        return list(candidates.items())
+
+    def _early_exit(self, candidates, k):
+        # 融合得分足够悬殊时直接按融合得分返回
+        if self.early_exit_gap is None or len(candidates) <= k:
+            return None
+        fused = [getattr(item, 'metadata', {}).get('score') for _, item in candidates]
+        if any(score is None for score in fused):
+            return None
+        ranked = sorted(zip(candidates, fused), key=lambda x: x[1], reverse=True)
+        kth, next_ = ranked[k - 1][1], ranked[k][1]
+        if kth <= 0 or (kth - next_) / kth < self.early_exit_gap:
+            return None
+        self.early_exits += 1
+        return [candidate for candidate, _ in ranked[:k]]
+
+    def _plan(self, docs, query, k):
+        # 去重, 判断是否可以跳过重排, 并查询得分缓存
+        candidates = self._candidates(docs)
+        res = self._early_exit(candidates, k)
+        if res is not None:
+            return res, None
+        query_key = self._normalize_query(query)
+        keys = [(query_key, self._doc_key(item, text)) for text, item in candidates]
+        scores = [self.cache.get(key) for key in keys]
+        todo = [i for i, score in enumerate(scores) if score is None]
+        pairs = [[query, candidates[i][0]] for i in todo]
+        return None, (candidates, keys, scores, todo, pairs)
+
+    def _finish(self, plan, new_scores, k):
+        candidates, keys, scores, todo, _ = plan
+        for i, score in zip(todo, new_scores):
+            scores[i] = score
+            self.cache.set(keys[i], score)
+        docs = [(candidates[i], scores[i]) for i in range(len(candidates))]
         docs = sorted(docs, key = lambda x: x[1], reverse = True)
         docs_ = []
         for item in docs:
             docs_.append(item[0])
-        return docs_[:k]
\ No newline at end of file
+        return docs_[:k]
+
+    @staticmethod
+    def _output(candidates, return_docs):
+        # candidates 为 (文本, 原始检索结果) 列表; return_docs=True 时返回原始检索结果(带 metadata 的 Document)
+        return [item if return_docs else text for text, item in candidates]
+
+    def rerank(self, docs, query, k=5, return_docs=False):
+        res, plan = self._plan(docs, query, k)
+        if res is None:
+            new_scores = self.score_pairs(plan[-1]) if plan[-1] else []
+            res = self._finish(plan, new_scores, k)
+        return self._output(res, return_docs)
+
+    async def arerank(self, docs, query, k=5, score=None, return_docs=False):
+        """
+            异步重排, score 为异步打分函数 (list[(query, doc)]) -> list[float], 例如跨请求的批处理调度器
+        """
+        res, plan = self._plan(docs, query, k)
+        if res is None:
+            new_scores = await score(plan[-1]) if plan[-1] else []
+            res = self._finish(plan, new_scores, k)
+        return self._output(res, return_docs)
+
+    def stats(self):
+        return dict(self.cache.stats(), early_exits=self.early_exits)
@@ -1,21 +1,29 @@
 from abc import ABC
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoTokenizer
 import torch
 import jieba
 from langchain.schema.embeddings import Embeddings
 from langchain.schema import Document
 from typing import List
 import numpy as np
-from rank_bm25 import BM25Okapi
+from .bm25 import BM25
+from .fusion import fuse
 from tqdm import tqdm
+from .backend import load_model, resolve_options
 # from langchain.vectorstores import FAISS
 
 
 class TextEmbedding(Embeddings, ABC):
-    def __init__(self, emb_model_name_or_path, batch_size=64, max_len=512, device='cuda', **kwargs):
+    def __init__(self, emb_model_name_or_path, batch_size=64, max_len=512, device=None, backend=None,
+                 quantize=None, num_threads=None, **kwargs):
 
         super().__init__(**kwargs)
-        self.model = AutoModel.from_pretrained(emb_model_name_or_path, trust_remote_code=True).half().to(device)
+        # device / backend / quantize / num_threads 为 None 时从环境变量读取, 见 backend.py
+        device, backend, quantize, num_threads = resolve_options(device, backend, quantize, num_threads)
+        self.model, device = load_model(emb_model_name_or_path, task='embedding', device=device, backend=backend,
+                                        quantize=quantize, num_threads=num_threads)
+        self.backend = backend
+        self.quantize = bool(quantize)
         self.tokenizer = AutoTokenizer.from_pretrained(emb_model_name_or_path, trust_remote_code=True)
         if 'bge' in emb_model_name_or_path:
             self.DEFAULT_QUERY_BGE_INSTRUCTION_ZH = "为这个句子生成表示以用于检索相关文章："
@@ -40,26 +48,29 @@ class TextEmbedding(Embeddings, ABC):
         W = np.dot(u, np.diag(1 / np.sqrt(s)))
         return W[:, :n_components], -mu
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def iter_embed_documents(self, texts: List[str], batch_size=None):
         """
-            Compute corpus embeddings using a HuggingFace transformer model.
+            按 token 长度排序后分批编码, 同一批内长度接近, 减少 padding 浪费.
+            整个语料只调用一次 tokenizer, 每批只做 pad 与一次前向.
         Args:
             texts: The list of texts to embed.
-        Returns:
-            List of embeddings, one for each text.
+            batch_size: 每批文本数, 默认为 self.batch_size
+        Yields:
+            (indices, embeddings): 本批文本在 texts 中的下标, 以及 float32 矩阵 [len(indices), dim]
         """
-        num_texts = len(texts)
+        if not texts:
+            return  # 空输入不调用 tokenizer
+        batch_size = batch_size or self.batch_size
         texts = [t.replace("\n", " ") for t in texts]
-        sentence_embeddings = []
+        encoded = self.tokenizer(texts, max_length=self.max_len, truncation=True)
+        order = sorted(range(len(texts)), key=lambda i: len(encoded['input_ids'][i]), reverse=True)
 
-        for start in range(0, num_texts, self.batch_size):
-            end = min(start + self.batch_size, num_texts)
-            batch_texts = texts[start:end]
-            encoded_input = self.tokenizer(batch_texts, max_length=512, padding=True, truncation=True,
-                                           return_tensors='pt').to(self.device)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            batch = {key: [encoded[key][i] for i in indices] for key in encoded.keys()}
+            encoded_input = self.tokenizer.pad(batch, padding=True, return_tensors='pt').to(self.device)
 
             with torch.no_grad():
-
                 model_output = self.model(**encoded_input)
                 # Perform pooling. In this case, cls pooling.
                 if 'gte' in self.emb_model_name_or_path:
@@ -68,13 +79,36 @@ class TextEmbedding(Embeddings, ABC):
                     batch_embeddings = model_output[0][:, 0]
 
                 batch_embeddings = torch.nn.functional.normalize(batch_embeddings, p=2, dim=1)
-                sentence_embeddings.extend(batch_embeddings.tolist())
+            yield indices, batch_embeddings.float().cpu().numpy()
 
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """
+            Compute corpus embeddings, returned as a float32 matrix in the order of texts.
+        """
+        embeddings = None
+        for indices, batch_embeddings in self.iter_embed_documents(texts):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+            embeddings[indices] = batch_embeddings
+        if embeddings is None:  # 空输入, torch 与 onnx 模型都带有 config
+            embeddings = np.empty((0, self.model.config.hidden_size), dtype=np.float32)
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+            Compute corpus embeddings using a HuggingFace transformer model.
+        Args:
+            texts: The list of texts to embed.
+        Returns:
+            List of embeddings, one for each text.
+        """
+        if not texts:
+            return []
         # sentence_embeddings = np.array(sentence_embeddings)
         # self.W, self.mu = self.compute_kernel_bias(sentence_embeddings)
         # sentence_embeddings = (sentence_embeddings+self.mu) @ self.W
         # self.W, self.mu = torch.from_numpy(self.W).cuda(), torch.from_numpy(self.mu).cuda()
-        return sentence_embeddings
+        return self.embed_documents_array(texts).tolist()
 
     def embed_query(self, text: str) -> List[float]:
         """
@@ -99,67 +133,363 @@ class TextEmbedding(Embeddings, ABC):
         # sentence_embeddings = (sentence_embeddings + self.mu) @ self.W
         return sentence_embeddings[0].tolist()
 
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+            一次前向计算多条查询的向量, 供跨请求的动态批处理使用
+        Returns:
+            float32 矩阵 [len(texts), dim]
+        """
+        texts = [self.DEFAULT_QUERY_BGE_INSTRUCTION_ZH + t.replace("\n", " ") for t in texts]
+        encoded_input = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_len,
+                                       return_tensors='pt').to(self.device)
+        with torch.no_grad():
+            model_output = self.model(**encoded_input)
+            # Perform pooling. In this case, cls pooling.
+            sentence_embeddings = model_output[0][:, 0]
+        sentence_embeddings = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=1)
+        return sentence_embeddings.float().cpu().numpy()
+
 
 from annoy import AnnoyIndex
+import threading
+import json
+import os
+import pickle
+import time
+
 
 class Retriever:
-    def __init__(self, emb_model_name_or_path=None, corpus=None, device='cuda', lan='zh', vector_dim=1024):
-        self.device = device
+    """
+        混合检索器(BM25 + Annoy), 以文件为单位增量维护索引:
+        - 每个 chunk 分配一个自增 id, 并记录其来源文件(source)
+        - 新增的 chunk 先进入增量区(delta), 查询时暴力计算相似度
+        - 删除文件时只对其 chunk 打墓碑(tombstone), 查询时过滤
+        - 增量区过大或墓碑比例过高时, 后台线程重建 Annoy 索引(compaction)
+    """
+    def __init__(self, emb_model_name_or_path=None, corpus=None, device=None, lan='zh', vector_dim=1024,
+                 n_trees=10, delta_max=2048, tombstone_ratio=0.2, backend=None, quantize=None, num_threads=None,
+                 retrieval_k=None, fusion='rrf', fusion_weights=None, rrf_k=60, candidate_top_n=None):
         self.lan = lan
         self.emb_model_name_or_path = emb_model_name_or_path
-        self.emb_model = TextEmbedding(emb_model_name_or_path=self.emb_model_name_or_path)
+        self.emb_model = TextEmbedding(emb_model_name_or_path=self.emb_model_name_or_path, device=device,
+                                       backend=backend, quantize=quantize, num_threads=num_threads)
+        self.device = self.emb_model.device
         self.vector_dim = vector_dim  # 向量维度
-        
-        self.corpus = []
-        self.id_to_doc = {}  # 用于存储文档的映射
-
-    def add(self, corpus=None):
-        self.annoy_index = AnnoyIndex(self.vector_dim, 'angular')  # 使用角度距离
-        # self.langchain_corpus = [Document(page_content=t) for t in corpus]
-        # print('len(self.langchain_corpus): ', len(self.langchain_corpus))
-        self.corpus = corpus
-        
-        tokenized_documents = []
+        self.n_trees = n_trees  # Annoy 树的数量
+        self.delta_max = delta_max  # 增量区最大 chunk 数, 超过后触发重建
+        self.tombstone_ratio = tombstone_ratio  # 墓碑占比超过该值后触发重建
+        self.retrieval_k = retrieval_k or {'bm25': 10, 'emb': 10}  # 每路检索的召回数量
+        self.fusion = fusion  # 多路结果融合方式: rrf / weighted
+        self.fusion_weights = fusion_weights  # 每路检索的融合权重
+        self.rrf_k = rrf_k
+        self.candidate_top_n = candidate_top_n  # 送入重排的候选数量上限, None 为不限制
+
+        self._lock = threading.RLock()
+        self._compact_thread = None
+        self.reset()
+        if corpus:
+            self.add(corpus)
+
+    def reset(self):
+        # 清空全部索引数据
+        with self._lock:
+            self.id_to_doc = {}  # chunk id -> 文本
+            self.id_to_source = {}  # chunk id -> 来源文件
+            self.id_to_meta = {}  # chunk id -> 附加元信息(如 PDF 页码), 没有时不记录
+            self.source_to_ids = {}  # 来源文件 -> chunk id 列表
+            self.id_to_vector = {}  # chunk id -> 向量, 重建 Annoy 时无需重新编码
+            self.next_id = 0
+
+            self.annoy_index = None
+            self.annoy_ids = []  # Annoy 内部下标 -> chunk id
+            self.delta_ids = []  # 尚未进入 Annoy 的 chunk id
+            self._delta_matrix = None  # 增量区向量矩阵缓存
+            self.deleted = set()  # 已删除但仍在 Annoy 中的 chunk id (墓碑)
+
+            self.bm25 = BM25()  # 倒排索引 BM25, 文档 id 即 chunk id
+
+    def _tokenize(self, text):
         if self.lan == 'zh':
-            method = lambda x: jieba.lcut(x)
-        else:
-            tokenized_documents = [doc.split() for doc in corpus]
-            method = lambda x: x.split()
-        for p in tqdm(corpus, desc='BM25 Embedding', unit='step'):
-            tokenized_documents.append(method(p))
-        self.bm25 = BM25Okapi(tokenized_documents)
-
-        # 构建 Annoy 索引
-        for idx, doc in tqdm(list(enumerate(corpus)), desc='Annoy Embedding', unit='step'):
-            embedding = self.emb_model.embed_documents([doc])[0]
-            self.annoy_index.add_item(idx, embedding)
-            self.id_to_doc[idx] = doc
-        self.annoy_index.build(10)  # 构建索引，10 为树的数量
+            return jieba.lcut(text)
+        return text.split()
+
+    def __len__(self):
+        return len(self.id_to_doc)
+
+    def _embed(self, corpus, reuse, progress=None):
+        """
+            批量编码 corpus, 结果直接写入预分配的矩阵, 每个 chunk 的向量为矩阵的一行
+        """
+        vectors = np.empty((len(corpus), self.vector_dim), dtype=np.float32)
+        todo = []
+        for i, doc in enumerate(corpus):
+            if doc in reuse:
+                vectors[i] = reuse[doc]
+            else:
+                todo.append(i)
+        done = len(corpus) - len(todo)
+        if progress is not None:
+            progress(done, len(corpus))
+        if not todo:  # 全部复用, 无需编码
+            return vectors
+        start = time.time()
+        with tqdm(total=len(todo), desc='Annoy Embedding', unit='chunk') as bar:
+            for indices, batch_embeddings in self.emb_model.iter_embed_documents([corpus[i] for i in todo]):
+                vectors[[todo[i] for i in indices]] = batch_embeddings
+                bar.update(len(indices))
+                done += len(indices)
+                if progress is not None:
+                    progress(done, len(corpus))
+        cost = time.time() - start
+        print(f'~ 编码 {len(todo)} 条, 复用 {len(corpus) - len(todo)} 条, '
+              f'{len(todo) / max(cost, 1e-6):.1f} chunks/s')
+        return vectors
+
+    def add(self, corpus=None, source=None, reuse=None, progress=None, metadata=None):
+        """
+            增量添加 chunk, 只对新增内容分词与编码
+        Args:
+            corpus: chunk 文本列表
+            source: 来源文件名, 用于之后按文件删除
+            reuse: 文本 -> 向量 的映射, 命中的 chunk 直接复用向量, 不再编码
+            progress: 编码进度回调, progress(已编码数, 总数)
+            metadata: 与 corpus 一一对应的元信息字典列表, 检索结果的 metadata 中会带上这些字段
+        Returns:
+            新增 chunk 的 id 列表
+        """
+        if not corpus:
+            return []
+        reuse = reuse or {}
+        tokens = [self._tokenize(p) for p in tqdm(corpus, desc='BM25 Embedding', unit='step')]
+        vectors = self._embed(corpus, reuse, progress)
+        metadata = metadata or [None] * len(corpus)
+        with self._lock:
+            ids = list(range(self.next_id, self.next_id + len(corpus)))
+            self.next_id += len(corpus)
+            for idx, doc, tok, vec, meta in zip(ids, corpus, tokens, vectors, metadata):
+                self.id_to_doc[idx] = doc
+                self.id_to_source[idx] = source
+                if meta:
+                    self.id_to_meta[idx] = meta
+                self.id_to_vector[idx] = vec
+                self.bm25.add(idx, tok)
+            self.source_to_ids.setdefault(source, []).extend(ids)
+            self.delta_ids.extend(ids)
+            self._delta_matrix = None
+        self._maybe_compact()
+        return ids
+
+    def remove(self, source):
+        """
+            删除某个来源文件的全部 chunk
+        Returns:
+            被删除的 chunk 数
+        """
+        with self._lock:
+            ids = self.source_to_ids.pop(source, [])
+            if not ids:
+                return 0
+            removed = set(ids)
+            for idx in ids:
+                self.id_to_doc.pop(idx, None)
+                self.id_to_source.pop(idx, None)
+                self.id_to_meta.pop(idx, None)
+                self.id_to_vector.pop(idx, None)
+            # 增量区中的 chunk 直接丢弃, 已进入 Annoy 的打墓碑
+            in_delta = [idx for idx in self.delta_ids if idx in removed]
+            if in_delta:
+                self.delta_ids = [idx for idx in self.delta_ids if idx not in removed]
+                self._delta_matrix = None
+            self.deleted.update(removed.difference(in_delta))
+            self.bm25.remove(ids)
+        self._maybe_compact()
+        return len(ids)
+
+    def _need_compact(self):
+        if len(self.delta_ids) > self.delta_max:
+            return True
+        return len(self.deleted) > self.tombstone_ratio * max(len(self.annoy_ids), 1)
+
+    def _maybe_compact(self):
+        with self._lock:
+            if not self._need_compact():
+                return
+            if self._compact_thread is not None and self._compact_thread.is_alive():
+                return
+            self._compact_thread = threading.Thread(target=self.compact, daemon=True)
+            self._compact_thread.start()
+
+    def compact(self):
+        """
+            重建 Annoy 索引: 合并增量区并清除墓碑, 构建期间不阻塞查询与写入
+            构建期间增量区或墓碑再次超过阈值时(写入期间 _maybe_compact 因本线程仍在运行而跳过), 继续重建
+        """
+        while True:
+            with self._lock:
+                ids = list(self.id_to_vector.keys())
+                vectors = [self.id_to_vector[idx] for idx in ids]
+            index = AnnoyIndex(self.vector_dim, 'angular')  # 使用角度距离
+            for i, vec in enumerate(vectors):
+                index.add_item(i, vec)
+            index.build(self.n_trees)
+            with self._lock:
+                snapshot = set(ids)
+                self.annoy_index = index
+                self.annoy_ids = ids
+                # 构建期间新增的 chunk 仍留在增量区, 构建期间删除的 chunk 仍需墓碑
+                self.delta_ids = [idx for idx in self.delta_ids if idx not in snapshot]
+                self._delta_matrix = None
+                self.deleted = {idx for idx in snapshot if idx not in self.id_to_vector}
+                again = self._need_compact()
+            print(f'~ 索引重建完成: {len(ids)} 条')
+            if not again:
+                return
+
+    def wait_compact(self):
+        thread = self._compact_thread
+        if thread is not None:
+            thread.join()
+
+    def vectors_of(self, source):
+        # 返回某个来源文件的 文本 -> 向量 映射, 文件修改后可复用未变化 chunk 的向量
+        with self._lock:
+            return {self.id_to_doc[idx]: self.id_to_vector[idx] for idx in self.source_to_ids.get(source, [])}
+
+    def save(self, path):
+        """
+            保存索引到目录 path:
+            - chunks.json: chunk id, 来源文件, 文本与元信息
+            - embeddings.npy: 向量矩阵, 行与 chunks.json 中的 id 一一对应
+            - bm25.pkl: BM25 倒排索引与统计量
+            - annoy.ann: Annoy 索引文件
+        """
+        self.wait_compact()
+        if self.delta_ids or self.deleted or self.annoy_index is None:
+            self.compact()  # 保存前合并增量区, 保证 Annoy 覆盖全部 chunk
+        with self._lock:
+            ids = list(self.annoy_ids)
+            chunks = {
+                'ids': ids,
+                'sources': [self.id_to_source[idx] for idx in ids],
+                'texts': [self.id_to_doc[idx] for idx in ids],
+                'metadata': [self.id_to_meta.get(idx) for idx in ids],
+            }
+            vectors = np.stack([self.id_to_vector[idx] for idx in ids]) if ids \
+                else np.zeros((0, self.vector_dim), dtype=np.float32)
+            bm25 = pickle.dumps(self.bm25)
+            annoy_index = self.annoy_index
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'chunks.json'), 'w', encoding='utf-8') as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        np.save(os.path.join(path, 'embeddings.npy'), vectors.astype(np.float32))
+        with open(os.path.join(path, 'bm25.pkl'), 'wb') as f:
+            f.write(bm25)
+        annoy_index.save(os.path.join(path, 'annoy.ann'))
+
+    def load(self, path):
+        """
+            从目录 path 加载索引, 向量矩阵与 Annoy 索引均为内存映射, 不需要重新编码
+        """
+        with open(os.path.join(path, 'chunks.json'), 'r', encoding='utf-8') as f:
+            chunks = json.load(f)
+        vectors = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'bm25.pkl'), 'rb') as f:
+            bm25 = pickle.load(f)
+        annoy_index = AnnoyIndex(self.vector_dim, 'angular')
+        annoy_index.load(os.path.join(path, 'annoy.ann'))  # mmap 加载
+
+        with self._lock:
+            ids = chunks['ids']
+            self.id_to_doc = dict(zip(ids, chunks['texts']))
+            self.id_to_source = dict(zip(ids, chunks['sources']))
+            # 旧快照中没有 metadata 字段
+            self.id_to_meta = {idx: meta for idx, meta in zip(ids, chunks.get('metadata') or []) if meta}
+            self.source_to_ids = {}
+            for idx, source in zip(ids, chunks['sources']):
+                self.source_to_ids.setdefault(source, []).append(idx)
+            self.id_to_vector = {idx: vectors[i] for i, idx in enumerate(ids)}
+            self.bm25 = bm25
+            self.annoy_index, self.annoy_ids = annoy_index, ids
+            self.delta_ids, self._delta_matrix, self.deleted = [], None, set()
+            self.next_id = max(len(bm25.doc_len), max(ids) + 1 if ids else 0)
+
+    def bm25_search(self, query, n=10):
+        # BM25 检索, 返回 [(chunk id, 得分)]
+        query = self._tokenize(query)  # 分词
+        with self._lock:
+            return self.bm25.top_k(query, n)
 
     def bm25_retrieval(self, query, n=10):
-        query = jieba.lcut(query)  # 分词
-        res = self.bm25.get_top_n(query, self.corpus, n=n)
-        return res
+        hits = self.bm25_search(query, n)
+        with self._lock:
+            return [self.id_to_doc[idx] for idx, _ in hits if idx in self.id_to_doc]
+
+    def _delta_search(self, query_embedding, k):
+        # 增量区暴力检索, 向量已归一化, 点积即余弦相似度
+        if not self.delta_ids:
+            return []
+        if self._delta_matrix is None:
+            self._delta_matrix = np.stack([self.id_to_vector[idx] for idx in self.delta_ids])
+        sims = self._delta_matrix @ query_embedding
+        top = np.argsort(-sims)[:k]
+        return [(self.delta_ids[i], float(sims[i])) for i in top]
+
+    def emb_search(self, query, k=10, query_embedding=None):
+        # 向量检索, 返回 [(chunk id, 余弦相似度)]; 已有查询向量时不再编码
+        if query_embedding is None:
+            query_embedding = self.emb_model.embed_query(query)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            hits = self._delta_search(query_embedding, k)
+            if self.annoy_index is not None:
+                # 多取墓碑数量的结果, 过滤后仍能凑满 k 条
+                n = k + len(self.deleted)
+                nearest_ids, distances = self.annoy_index.get_nns_by_vector(query_embedding, n,
+                                                                            include_distances=True)
+                for i, dist in zip(nearest_ids, distances):
+                    idx = self.annoy_ids[i]
+                    if idx not in self.deleted:
+                        hits.append((idx, 1 - dist ** 2 / 2))  # angular 距离换算为余弦相似度
+        return sorted(hits, key=lambda x: x[1], reverse=True)[:k]
 
     def emb_retrieval(self, query, k=10):
-        query_embedding = self.emb_model.embed_query(query)
-        nearest_ids = self.annoy_index.get_nns_by_vector(query_embedding, k, include_distances=False)
-        res = [self.id_to_doc[idx] for idx in nearest_ids]
-        return res
+        hits = self.emb_search(query, k)
+        with self._lock:
+            return [self.id_to_doc[idx] for idx, _ in hits if idx in self.id_to_doc]
 
-    def retrieval(self, query, methods=None):
+    def retrieval(self, query, methods=None, k=None, fusion=None, weights=None, top_n=None, query_embedding=None):
+        """
+            混合检索, 多路结果按融合得分排序并去重
+        Args:
+            methods: 检索方式列表, 默认 ['bm25', 'emb']
+            k: {检索方式: 召回数量}, 默认使用 self.retrieval_k
+            fusion: 'rrf' 或 'weighted', 默认使用 self.fusion
+            weights: {检索方式: 融合权重}, 默认使用 self.fusion_weights
+            top_n: 只返回前 top_n 个候选, 默认使用 self.candidate_top_n
+            query_embedding: 预先计算好的查询向量, 为 None 时在向量检索中编码
+        Returns:
+            Document 列表, metadata 中包含 id, source, score(融合得分), 以及添加时提供的元信息(如 page)
+        """
         if methods is None:
             methods = ['bm25', 'emb']
-        search_res = list()
+        k = dict(self.retrieval_k, **(k or {}))
+        results = {}
         for method in methods:
             if method == 'bm25':
-                bm25_res = self.bm25_retrieval(query)
-                for item in bm25_res:
-                    if item not in search_res:
-                        search_res.append(item)
+                results[method] = self.bm25_search(query, k.get(method, 10))
             elif method == 'emb':
-                emb_res = self.emb_retrieval(query)
-                for item in emb_res:
-                    if item not in search_res:
-                        search_res.append(item)
-        return search_res
\ No newline at end of file
+                results[method] = self.emb_search(query, k.get(method, 10), query_embedding=query_embedding)
+        return self._fuse(results, fusion, weights, top_n)
+
+    def _fuse(self, results, fusion=None, weights=None, top_n=None):
+        with self._lock:
+            # 过滤掉检索之后被并发删除的 chunk
+            results = {name: [(idx, score) for idx, score in hits if idx in self.id_to_doc]
+                       for name, hits in results.items()}
+            fused = fuse(results, self.id_to_doc, method=fusion or self.fusion,
+                         weights=weights if weights is not None else self.fusion_weights,
+                         rrf_k=self.rrf_k, top_n=top_n if top_n is not None else self.candidate_top_n)
+            return [Document(page_content=self.id_to_doc[idx],
+                             metadata={**self.id_to_meta.get(idx, {}), 'id': idx, 'source': self.id_to_source[idx],
+                                       'score': score})
+                    for idx, score in fused]
@@ -0,0 +1,137 @@
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = (
+    'InferencePool',
+    'BatchScheduler',
+)
+
+
+class InferencePool:
+    """
+        模型推理线程池: 同步的编码/重排在有界线程池中执行, 不阻塞事件循环.
+        排队中与执行中的任务数超过 max_pending 时拒绝新任务(准入控制).
+    """
+    def __init__(self, max_workers=2, max_pending=32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inference')
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def overloaded(self):
+        return self.pending >= self.max_pending
+
+    async def run(self, fn, *args, **kwargs):
+        if self.overloaded():
+            self.rejected += 1
+            raise RuntimeError('推理任务过多, 请稍后重试')
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BatchScheduler:
+    """
+        跨请求的动态批处理: 收集并发请求提交的数据, 等待 max_wait_ms 毫秒或凑满 max_batch 条后,
+        在推理线程池中作为一批执行 fn, 再把结果分发给各自的调用方.
+        fn 为同步函数, 输入为列表, 返回等长的结果序列.
+    """
+    def __init__(self, fn, pool, max_batch=32, max_wait_ms=5, name='batch'):
+        self.fn = fn
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = None
+        self._worker = None
+        # 统计信息
+        self.batches = 0
+        self.items = 0
+        self.busy_time = 0.0
+        self.largest_batch = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        # 提交一条数据, 等待所在批次执行完成后返回对应结果
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def submit_many(self, items):
+        return list(await asyncio.gather(*[self.submit(item) for item in items]))
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # 已在队列中的数据直接并入本批
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = await self.pool.run(self.fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.busy_time += time.perf_counter() - start
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'items_per_sec': self.items / self.busy_time if self.busy_time else 0.0,
+        }
@@ -0,0 +1,126 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = (
+    'IngestJob',
+    'IngestQueue',
+)
+
+
+class IngestJob:
+    """
+        一次文件入库任务: 状态依次为 queued -> running -> done / failed
+    """
+    def __init__(self, filename, path):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.status = 'queued'
+        self.stage = ''  # running 时的当前阶段, 如 parsing / embedding
+        self.chunks_done = 0
+        self.chunks_total = 0
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._embed_start = None
+
+    def progress(self, done, total):
+        # 编码进度回调, 由 Retriever.add 在工作线程中调用
+        if self._embed_start is None:
+            self._embed_start = time.monotonic()
+        self.stage = 'embedding'
+        self.chunks_done, self.chunks_total = done, total
+
+    @property
+    def eta(self):
+        # 按已编码的速度估算剩余秒数
+        if self.status != 'running' or not self.chunks_done or self._embed_start is None:
+            return None
+        rate = self.chunks_done / max(time.monotonic() - self._embed_start, 1e-6)
+        return (self.chunks_total - self.chunks_done) / rate
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'stage': self.stage,
+            'chunks_done': self.chunks_done,
+            'chunks_total': self.chunks_total,
+            'eta_s': self.eta,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class IngestQueue:
+    """
+        后台入库队列: 上传接口只负责保存文件并提交任务, 解析, 切分, 编码与写入索引在后台线程中执行.
+        同时执行的任务数不超过 concurrency, 其余任务排队; 只保留最近 max_jobs 个任务的状态.
+        handler(job) 为同步函数, 负责处理单个任务并通过 job.progress 报告进度.
+    """
+    def __init__(self, handler, concurrency=1, max_jobs=200):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ingest')
+        self._queue = None
+        self._workers = []
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [w for w in self._workers if not w.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < self.concurrency:
+            self._workers.append(loop.create_task(self._run()))
+
+    def submit(self, filename, path):
+        self._ensure_workers()
+        job = IngestJob(filename, path)
+        self.jobs[job.id] = job
+        # 超出保留数量时丢弃最早的已结束任务
+        for job_id in [i for i, j in self.jobs.items() if j.status in ('done', 'failed')]:
+            if len(self.jobs) <= self.max_jobs:
+                break
+            del self.jobs[job_id]
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                await loop.run_in_executor(self.executor, self.handler, job)
+                job.status = 'done'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                print(f'ERROR: 入库任务失败: {job.filename}', str(e))
+            finally:
+                job.stage = ''
+                job.finished = time.time()
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {'concurrency': self.concurrency, 'jobs': counts}
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
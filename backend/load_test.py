@@ -0,0 +1,89 @@
+"""
+    /api/process 并发压测, 统计首字延迟(time-to-first-token)与总耗时. 先启动后端, 再运行:
+        python load_test.py --concurrency 50 --rag
+"""
+import time
+import json
+import asyncio
+import argparse
+import numpy as np
+import httpx
+
+QUESTIONS = ['怎样加热座椅？', '座椅加热怎么打开', '如何调节后视镜', '车辆保养周期是多久', '胎压报警怎么处理']
+
+
+async def one_request(client, url, question, use_rag, use_mcp):
+    messages = [
+        {'type': 'system', 'text': '你是一个智能助手'},
+        {'type': 'user', 'text': question},
+        {'type': 'assistant', 'text': ''},
+    ]
+    body = {'messages': messages, 'useRAG': use_rag, 'useMCP': use_mcp}
+    start = time.perf_counter()
+    first = None
+    async with client.stream('POST', url, json=body) as response:
+        if response.status_code != 200:
+            return None, None, response.status_code
+        buffer = ''
+        async for chunk in response.aiter_text():
+            buffer += chunk
+            # 按空行切分出完整的 SSE 事件, 不完整的部分留到下一块
+            *frames, buffer = buffer.split('\n\n')
+            for frame in frames:
+                event, data = _parse_frame(frame)
+                if event == 'error':
+                    return None, None, 'error'
+                # 首字延迟从第一个带内容的 message 事件开始计算, sources 等其他事件不计入
+                if event == 'message' and data.get('content') and first is None:
+                    first = time.perf_counter() - start
+    return first, time.perf_counter() - start, 200
+
+
+def _parse_frame(frame):
+    # 解析一个 SSE 事件, 返回 (事件名, data), 没有 event 行时事件名为 message
+    event, data = 'message', []
+    for line in frame.split('\n'):
+        if line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data.append(line[len('data:'):].strip())
+    try:
+        return event, json.loads('\n'.join(data)) if data else {}
+    except ValueError:
+        return event, {}
+
+
+def _report(name, costs):
+    if not costs:
+        print(f'{name:<8} 无数据')
+        return
+    costs = np.asarray(costs) * 1000
+    print(f'{name:<8} p50={np.percentile(costs, 50):9.1f}ms  p99={np.percentile(costs, 99):9.1f}ms  '
+          f'max={costs.max():9.1f}ms')
+
+
+async def main(args):
+    url = args.host.rstrip('/') + '/api/process'
+    async with httpx.AsyncClient(timeout=None) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            one_request(client, url, QUESTIONS[i % len(QUESTIONS)], args.rag, args.mcp)
+            for i in range(args.concurrency)
+        ])
+        cost = time.perf_counter() - start
+    ok = [(first, total) for first, total, code in results if code == 200 and first is not None]
+    codes = {}
+    for _, _, code in results:
+        codes[code] = codes.get(code, 0) + 1
+    print(f'~ 并发数: {args.concurrency}, 总耗时: {cost:.1f}s, 状态码: {codes}')
+    _report('TTFT', [first for first, _ in ok])
+    _report('Total', [total for _, total in ok])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='/api/process load test')
+    parser.add_argument('--host', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rag', action='store_true')
+    parser.add_argument('--mcp', action='store_true')
+    asyncio.run(main(parser.parse_args()))
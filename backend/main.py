@@ -1,3 +1,12 @@
+if __name__ == "__main__":
+    # 直接运行 main.py 时, 以模块方式(main:app)交给 uvicorn 加载应用.
+    # PDF 解析的子进程以 spawn 方式启动, 会重新导入 __main__ 模块, 因此 __main__ 不能是加载模型的 main.py
+    import sys
+    import runpy
+    sys.argv = ['uvicorn', 'main:app', '--host', '0.0.0.0', '--port', '8000']
+    runpy.run_module('uvicorn', run_name='__main__', alter_sys=True)
+    sys.exit()
+
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
@@ -8,6 +17,12 @@ import json
 import asyncio
 from LLM import llm  # 导入LLM模型接口
 from MCP import agent  # 导入多智能体协作模块
+from inference import InferencePool, BatchScheduler  # 模型推理线程池与动态批处理
+from streaming import sse_stream  # SSE 流式输出
+from rewrite import QueryRewriter  # RAG 查询改写
+from semantic_cache import SemanticCache  # 语义答案缓存
+from retrieval import RetrievalOrchestrator  # 多路检索编排
+from ingest import IngestQueue  # 后台入库任务队列
 
 # 导入RAG(检索增强生成)模块并初始化知识库
 # from RAG import knowledgeBase, query
@@ -17,8 +32,19 @@ from bge_RAG import RAG
 # 从环境变量获取文本分块参数并初始化RAG
 kb = RAG(max_len=os.environ['max_len'], overlap_len=os.environ['overlap_len'])
 
-# 加载已保存的知识库索引
+# 加载已保存的知识库快照, 只重新编码内容变化的文件
 kb.load()
+
+# 检索/重排等同步推理放入有界线程池, 避免阻塞事件循环; 排队任务过多时拒绝新请求
+pool = InferencePool(max_workers=int(os.environ.get('INFERENCE_WORKERS') or 2),
+                     max_pending=int(os.environ.get('INFERENCE_MAX_PENDING') or 32))
+# 并发请求的查询编码与重排打分合并为一批执行
+embed_batcher = BatchScheduler(kb.retriever.emb_model.embed_queries, pool, name='embed',
+                               max_batch=int(os.environ.get('EMBED_MAX_BATCH') or 32),
+                               max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS') or 5))
+rerank_batcher = BatchScheduler(kb.reranker.score_pairs, pool, name='rerank',
+                                max_batch=int(os.environ.get('RERANK_MAX_BATCH') or 64),
+                                max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS') or 5))
 # kb.add()
 # 取消注释以下代码可在启动时自动加载指定目录下的所有文本文件
 # root = 'uploaded_files'
@@ -28,6 +54,44 @@ kb.load()
 #         kb.add(path)
 #         # graph_rag.up(path, llm)
 
+# 查询改写: 按 (历史, 输入) 缓存改写结果
+rewriter = QueryRewriter(llm, maxsize=int(os.environ.get('REWRITE_CACHE_SIZE') or 1024),
+                         ttl=float(os.environ.get('REWRITE_CACHE_TTL') or 600),
+                         stream=os.environ.get('REWRITE_STREAM', '1').strip() == '1')
+
+# 语义答案缓存(可选): 相似问题且知识库未变化时直接回放缓存的回答
+semantic_cache = None
+if os.environ.get('SEMANTIC_CACHE', '0').strip() == '1':
+    semantic_cache = SemanticCache(threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD') or 0.92),
+                                   maxsize=int(os.environ.get('SEMANTIC_CACHE_SIZE') or 512),
+                                   ttl=float(os.environ.get('SEMANTIC_CACHE_TTL') or 3600))
+
+# 图谱检索(可选): USE_GRAPH_RAG=1 时与向量检索并发执行, 超过截止时间的图谱结果不再等待
+graph_rag = None
+if os.environ.get('USE_GRAPH_RAG', '0').strip() == '1':
+    from Graph_RAG import GraphRAG, graph_version
+    graph_rag = GraphRAG()
+
+retrieval = RetrievalOrchestrator(deadline_ms=float(os.environ.get('RETRIEVAL_DEADLINE_MS') or 800))
+
+async def _vector_source(query, query_embedding=None):
+    # 编码与重排与其他请求合并批处理
+    return await kb.areq(query, top_k=3, embed=embed_batcher.submit,
+                         score=rerank_batcher.submit_many, run=pool.run,
+                         query_embedding=query_embedding)
+
+async def _graph_source(query, query_embedding=None):
+    res = await graph_rag.aquery(query)
+    return res['context'] if res else ''
+
+retrieval.register('vector', _vector_source, required=True)
+if graph_rag is not None:
+    retrieval.register('graph', _graph_source)
+
+def knowledge_version():
+    # 知识库与图谱的版本, 任一变化时语义缓存失效
+    return (kb.version, graph_version.value) if graph_rag is not None else kb.version
+
 # 初始化FastAPI应用
 app = FastAPI()
 
@@ -40,6 +104,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 应用启动时启动常驻的 MCP 工具会话, 之后的请求复用, 不再每次启动 MCP 服务
+@app.on_event("startup")
+async def start_mcp_pool():
+    await agent.pool.start()
+
+@app.on_event("shutdown")
+async def stop_mcp_pool():
+    await agent.pool.stop()
+
+# 应用关闭时保存知识库快照, 下次启动只需加载快照, 无需重新编码
+@app.on_event("shutdown")
+def save_knowledge_base():
+    pool.shutdown()
+    kb.save()
+
 # 定义API请求模型
 class TextRequest(BaseModel):
     messages: Any  # 对话历史消息
@@ -79,28 +158,43 @@ async def generate_stream_RAG(request):
         user_input = message[-1]['text']
         print('用户输入: ', user_input)
         
-        # 调用LLM进行查询改写，提高检索准确性
-        change_input = llm.invoke([{'role':'user', 'content':f'''你需要根据历史信息和用户输入, 为我进行查询改写.\n---例如: 用户在历史信息中提问:厨房有什么东西?你回答有菜刀, 冰箱等. 然后用户提问:第一个的作用. 你应该改写查询为:厨房里菜刀的作用? 如果用户提问一个新的话题, 改写后的内容应该保持不变!如:历史提问:今天吃什么? 提问:明天去哪玩? 你应该保持不变, 输出:明天去哪玩?\n---重要的: 你应该除了改写后的输入, 其他什么都不要输出! \n---历史信息:{message}; \n---用户输入: {user_input} ---输出:'''}]).content
+        # 调用LLM进行查询改写，提高检索准确性(无历史或无指代时跳过, 结果缓存)
+        change_input = await rewriter.rewrite(message, user_input)
         print(f'查询改写: {user_input} -> {change_input}')
         
-        # 使用改写后的查询进行RAG检索，获取相关文档
-        Unstructured = kb.req(change_input, top_k=3)
-        
-        # 保留结构化知识检索的接口(当前未启用)
-        # Structured = graph_rag(user_input)['context']
-        Structured = ''
+        # 语义缓存: 相似问题直接回放缓存的回答
+        query_embedding = None
+        if semantic_cache is not None:
+            kb_version = knowledge_version()
+            query_embedding = await embed_batcher.submit(change_input)
+            cached, sim = semantic_cache.lookup(query_embedding, kb_version)
+            if cached is not None:
+                print(f'~ 命中语义缓存: {change_input}, 相似度: {sim:.3f}')
+                for content in cached:
+                    yield content
+                return
+
+        # 使用改写后的查询并发进行向量检索与图谱检索, 图谱检索超过截止时间则放弃
+        results, report = await retrieval.retrieve(change_input, query_embedding=query_embedding)
+        Unstructured = results.get('vector', '')
+        Structured = results.get('graph', '')
+        yield {'event': 'sources', 'data': report}
         print('-'*100)
-        # print('graph_RAG结果: ', Structured)
+        print('~ 检索来源: ', report)
+        print('~ graph_RAG结果: ', Structured)
         print('~ RAG结果: \n', Unstructured)
         print('-'*100)
         
         # 构建提示词，将检索结果和用户问题一起提供给LLM
+        structured_part = f'''
+- Structured data:
+{Structured}''' if Structured else ''
         prompt = f'''
 你是一个智能问答系统, 你会完全按照用户的要求进行返回.
 ---需求
-你会根据知识库的查询内容(Unstructured documents) 和对话历史信息进行智能回答.
+你会根据知识库的查询内容(Unstructured documents{', Structured data' if Structured else ''}) 和对话历史信息进行智能回答.
 - Unstructured documents:
-{Unstructured}
+{Unstructured}{structured_part}
 --- 输入:
 {user_input}
 --- 输出:
@@ -110,18 +204,21 @@ async def generate_stream_RAG(request):
         print('messages: ', messages)
         
         # 流式调用LLM并返回结果
-        for chunk in llm.stream(messages):
+        answer = []
+        async for chunk in llm.astream(messages):
             if chunk.content:
                 content = chunk.content
-                # 将数据包装成事件流格式
+                answer.append(content)
                 yield content
-                await asyncio.sleep(0.01)  # 控制流速度
+        # 完整生成后写入语义缓存
+        if semantic_cache is not None:
+            semantic_cache.store(query_embedding, change_input, answer, kb_version)
 
     except Exception as e:
         # 发生异常时返回错误信息
         error_response = {'error': str(e), 'done': True}
         print(f"发生错误: {error_response}")
-        yield f"{json.dumps(error_response)}"
+        yield {'event': 'error', 'data': error_response}
 
 
 # 生成普通流式响应(不使用RAG)
@@ -138,18 +235,16 @@ async def generate_stream(request):
         print('INFO: ', info)
 
         # 流式调用LLM并返回结果
-        for chunk in llm.stream(messages):
+        async for chunk in llm.astream(messages):
             if chunk.content:
                 content = chunk.content
-                # 将数据包装成事件流格式
                 yield content
-                await asyncio.sleep(0.01)  # 控制流速度
 
     except Exception as e:
         # 发生异常时返回错误信息
         error_response = {'error': str(e), 'done': True}
         print(f"发生错误: {error_response}")
-        yield f"{json.dumps(error_response)}"
+        yield {'event': 'error', 'data': error_response}
 
 # 生成多智能体协作处理的流式响应
 async def generate_stream_mcp(request):
@@ -167,13 +262,16 @@ async def generate_stream_mcp(request):
         # 调用多智能体协作处理并流式返回结果
         async for chunk in agent.run(llm, messages):
             yield chunk
-            await asyncio.sleep(0.01)  # 控制流速度
 
     except Exception as e:
         # 发生异常时返回错误信息
         error_response = {'error': str(e), 'done': True}
         print(f"发生错误: {error_response}")
-        yield f"{json.dumps(error_response)}"
+        yield {'event': 'error', 'data': error_response}
+
+# 流式输出的合并发送策略
+STREAM_FLUSH_BYTES = int(os.environ.get('STREAM_FLUSH_BYTES') or 64)
+STREAM_FLUSH_MS = float(os.environ.get('STREAM_FLUSH_MS') or 50)
 
 # 处理文本请求的API端点
 @app.post("/api/process")
@@ -185,19 +283,40 @@ async def generate_text(request: TextRequest):
     useRAG = request.useRAG
     useMCP = request.useMCP
     if useRAG:
+        if pool.overloaded():
+            # 准入控制: 推理队列已满时直接拒绝, 不再排队等待
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="服务繁忙, 请稍后重试")
         func = generate_stream_RAG
     elif useMCP:
         func = generate_stream_mcp
     else:
         func = generate_stream
         
-    # 返回流式响应
+    # 返回流式响应: 首个 token 立即发送, 之后按字节数或时间窗口合并发送
     return StreamingResponse(
-        content=func(request),
-        media_type="text/event-stream"
+        content=sse_stream(func(request), flush_bytes=STREAM_FLUSH_BYTES, flush_interval=STREAM_FLUSH_MS / 1000),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+# 推理性能指标API: 线程池, 动态批处理与重排缓存
+@app.get("/api/metrics")
+async def get_metrics():
+    return {
+        "pool": pool.stats(),
+        "embed_batcher": embed_batcher.stats(),
+        "rerank_batcher": rerank_batcher.stats(),
+        "reranker": kb.reranker.stats(),
+        "rewriter": rewriter.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "retrieval": retrieval.stats(),
+        "ingest": ingest_queue.stats(),
+        "mcp": agent.stats(),
+    }
+
+
 # 文件类型检查辅助函数
 ALLOWED_EXTENSIONS = {'txt'}
 def allowed_file(filename):
@@ -213,61 +332,94 @@ import os, shutil
 UPLOAD_DIR = "uploaded_files"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# 文件上传API端点
+# 上传文件分块写入磁盘的块大小
+UPLOAD_CHUNK_BYTES = int(os.environ.get('UPLOAD_CHUNK_BYTES') or 1024 * 1024)
+
+def ingest_file(job):
+    # 后台入库: docx 转为 txt, 再切分, 编码并写入索引; pdf 保留原文件, 按页解析以记录页码
+    save_path = job.path
+    if save_path.lower().endswith('.docx'):
+        job.stage = 'parsing'
+        file_path = save_path[:-len('.docx')] + '.txt'
+        from read_docs import docx_to_txt
+        docx_to_txt(save_path, file_path)  # 逐段落/表格行流式写入
+        os.remove(save_path)  # 删除原始docx文件
+        save_path = file_path  # 更新路径为转换后的txt文件
+
+    # 将文件内容添加到RAG知识库, 只索引新上传的文件
+    job.stage = 'embedding'
+    try:
+        kb.add(save_path, progress=job.progress)
+    finally:
+        if semantic_cache is not None:
+            semantic_cache.invalidate()  # 知识库变化(入库失败时同名文件的旧 chunk 也已删除), 缓存的回答失效
+    # graph_rag.up(save_path, llm)
+
+ingest_queue = IngestQueue(ingest_file, concurrency=int(os.environ.get('INGEST_CONCURRENCY') or 1))
+
+@app.on_event("shutdown")
+def stop_ingest_queue():
+    ingest_queue.shutdown()
+
+# 文件上传API端点: 文件分块写入磁盘后立即返回任务 id, 入库在后台执行
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
     print('~ 上传文件: ', file.filename)
     
     # 校验文件扩展名
-    ext = file.filename.rsplit(".", 1)[-1].lower()
-    if ext not in {"txt", "docx"}:
+    filename = os.path.basename(file.filename)
+    ext = filename.rsplit(".", 1)[-1].lower()
+    if ext not in {"txt", "docx", "pdf"}:
         raise HTTPException(status_code=400, detail="不支持的文件类型")
     
-    # 构造本地存储路径
-    save_path = os.path.join(UPLOAD_DIR, file.filename)
+    # 构造本地存储路径, 先写入临时文件, 完整写入后再替换, 避免入库读到半个文件
+    save_path = os.path.join(UPLOAD_DIR, filename)
+    tmp_path = save_path + '.part'
+    size = 0
     
     try:
-        # 保存上传的文件
-        with open(save_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        # 分块读取上传内容并写入磁盘, 不把整个文件读入内存
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+        os.replace(tmp_path, save_path)
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise HTTPException(status_code=500, detail=f"保存文件失败：{e}")
     finally:
         await file.close()
+
+    job = ingest_queue.submit(filename, save_path)
     
-    # 处理docx文件，转换为txt格式
-    if 'docx' in file.filename:
-        file_base_name = ''.join(file.filename.split('.')[:-1])+'.txt'
-        print(file_base_name)
-        file_path = os.path.join(UPLOAD_DIR, file_base_name)
-        
-        from read_docs import read_docx
-        res = read_docx(save_path)
+    # 返回上传成功信息与入库任务 id
+    return {"filename": filename, "size": size, "job_id": job.id}
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(res)
-        os.remove(save_path)  # 删除原始docx文件
-        save_path = file_path  # 更新路径为转换后的txt文件
 
-    # 将文件内容添加到RAG知识库
-    kb.add(save_path, spiltNum=128, chunk_overlap=16)
-    # graph_rag.up(save_path, llm)
-    
-    # 返回上传成功信息
-    return {"filename": file.filename, "size": os.path.getsize(save_path)}
+# 入库任务进度API: 状态, 已编码 chunk 数与预计剩余时间
+@app.get("/api/ingest-jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+    return job.to_dict()
 
 
 # 获取知识库文件列表API
 @app.get("/api/knowledge-base")
 async def get_knowledge_base():
     """
-    返回 UPLOAD_DIR 目录中所有 .txt 文件的名称与大小列表
+    返回 UPLOAD_DIR 目录中所有 .txt / .pdf 文件的名称与大小列表
     """
     print('~ 打印知识库列表')
     try:
         files = []
         for fn in os.listdir(UPLOAD_DIR):
-            if fn.lower().endswith(".txt"):
+            if fn.lower().endswith((".txt", ".pdf")):
                 path = os.path.join(UPLOAD_DIR, fn)
                 size_kb = os.path.getsize(path) / 1024
                 files.append({
@@ -298,22 +450,11 @@ async def delete_knowledge_file(filename: str):
     try:
         os.remove(file_path)  # 删除文件
         kb.delete(file_path)  # 从RAG知识库中删除
+        if semantic_cache is not None:
+            semantic_cache.invalidate()  # 知识库变化, 缓存的回答失效
         # graph_rag.clear(file_path)  # 从图数据库中清除
         # 如果有重新加载知识库的逻辑，可以在这里调用
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"删除文件失败：{e}")
     return {"message": "文件删除成功"}
-
-
-# 应用启动和关闭处理
-if __name__ == "__main__":
-    import atexit
-    # 注册应用退出时的回调函数，保存RAG知识库
-    # atexit.register(lambda: kb.save('RAG/save.pkl'))
-    
-    import uvicorn
-    print(generate_stream('你好'))  # 测试流式响应函数
-    
-    # 启动FastAPI应用
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
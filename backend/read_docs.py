@@ -1,42 +1,134 @@
 from docx import Document
-from tqdm import tqdm
-from docx.oxml import OxmlElement
 from docx.oxml.text.paragraph import CT_P
 from docx.oxml.table import CT_Tbl
+from docx.oxml.ns import qn
 
 def normalize_text(text):
     """标准化文本，去除多余空格和换行"""
     return ' '.join(text.split())
 
-def read_docx(file_path):
-    # 打开文档
+_T, _TAB, _BR, _CR, _P = qn('w:t'), qn('w:tab'), qn('w:br'), qn('w:cr'), qn('w:p')
+
+def _element_text(element):
+    """
+    直接从 XML 取出元素内的文本, 比 python-docx 的 Paragraph.text 快得多.
+    只取 w:t 的文本, 制表符与换行记为空白; python-docx 1.x 中段落与 run 元素的 .text 已是拼接后的文本,
+    逐节点取 .text 会把同一段文字重复多次.
+    """
+    parts = []
+    for node in element.iter(_T, _TAB, _BR, _CR, _P):
+        tag = node.tag
+        if tag == _T:
+            parts.append(node.text or '')
+        elif tag == _P:
+            if node is not element:
+                parts.append('\n')  # 单元格内的多个段落
+        else:
+            parts.append('\t' if tag == _TAB else '\n')
+    return ''.join(parts)
+
+def iter_docx(file_path):
+    """
+    按文档顺序逐个产出段落与表格行(已标准化, 重复内容只产出一次):
+    - 只遍历一次文档主体, 表格通过预先建立的 元素 -> 表格 映射查找
+    - 去重只保存内容的哈希值
+    """
     doc = Document(file_path)
-    res = ''
-    seen_content = set()  # 用于记录已解析的内容，避免重复
-
-    print("文档内容：")
-    for element in tqdm(doc.element.body):
-        if element.tag.endswith('p'):  # 如果是段落
-            para = ''.join(node.text for node in element.iter() if node.text).strip()
-            normalized_para = normalize_text(para)
-            if normalized_para and normalized_para not in seen_content:
-                res += normalized_para + '\n'
-                seen_content.add(normalized_para)
-        elif element.tag.endswith('tbl'):  # 如果是表格
-            table = next((tbl for tbl in doc.tables if tbl._element == element), None)
-            if table:
-                for row in table.rows:
-                    row_text = '\t'.join(normalize_text(cell.text) for cell in row.cells)
-                    if row_text and row_text not in seen_content:
-                        res += row_text + '\n'
-                        seen_content.add(row_text)
-
-    return res
+    tables = {tbl._element: tbl for tbl in doc.tables}
+    seen = set()  # 已产出内容的哈希, 避免重复
+
+    for element in doc.element.body:
+        if isinstance(element, CT_P):  # 如果是段落
+            lines = [normalize_text(_element_text(element))]
+        elif isinstance(element, CT_Tbl) and element in tables:  # 如果是表格
+            lines = ['\t'.join(normalize_text(_element_text(cell._tc)) for cell in row.cells) for row in tables[element].rows]
+        else:
+            continue
+        for line in lines:
+            key = hash(line)
+            if line and key not in seen:
+                seen.add(key)
+                yield line
+
+def read_docx(file_path):
+    # 返回整个文档的文本, 每个段落/表格行一行
+    return ''.join(line + '\n' for line in iter_docx(file_path))
+
+def docx_to_txt(file_path, txt_path):
+    # 边解析边写入, 不在内存中拼接整个文档
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.writelines(line + '\n' for line in iter_docx(file_path))
 
 # 使用示例
 if __name__ == '__main__':
-    name = '布洛芬'
-    res = read_docx(rf"D:\Mypower\Git\MyPython\大学\NLP\project\books\{name}.docx")
+    # 性能测试: 生成包含大量表格的文档, 对比逐表格查找的旧实现
+    #   python read_docs.py --tables 400 --rows 20
+    import os
+    import time
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tables', type=int, default=400)
+    parser.add_argument('--rows', type=int, default=20)
+    parser.add_argument('--cols', type=int, default=4)
+    args = parser.parse_args()
+
+    def read_docx_old(file_path):
+        doc = Document(file_path)
+        res = ''
+        seen_content = set()
+        for element in doc.element.body:
+            if element.tag.endswith('p'):
+                para = ''.join(node.text for node in element.iter() if node.text).strip()
+                normalized_para = normalize_text(para)
+                if normalized_para and normalized_para not in seen_content:
+                    res += normalized_para + '\n'
+                    seen_content.add(normalized_para)
+            elif element.tag.endswith('tbl'):
+                table = next((tbl for tbl in doc.tables if tbl._element == element), None)
+                if table:
+                    for row in table.rows:
+                        row_text = '\t'.join(normalize_text(cell.text) for cell in row.cells)
+                        if row_text and row_text not in seen_content:
+                            res += row_text + '\n'
+                            seen_content.add(row_text)
+        return res
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.docx')
+    doc = Document()
+    for t in range(args.tables):
+        doc.add_paragraph(f'第 {t} 节 说明文字, 包含  多余的   空格.')
+        table = doc.add_table(rows=args.rows, cols=args.cols)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f'表{t} 行{r} 列{c}'
+    doc.save(path)
+    print(f'文档: {args.tables} 个表格, 每个 {args.rows} 行 x {args.cols} 列')
+
+    def read_docx_ref(file_path):
+        # 使用 python-docx 的 Paragraph.text / Cell.text 作为正确结果
+        doc = Document(file_path)
+        tables = {tbl._element: tbl for tbl in doc.tables}
+        paragraphs = {p._element: p for p in doc.paragraphs}
+        res, seen = '', set()
+        for element in doc.element.body:
+            if element in paragraphs:
+                lines = [normalize_text(paragraphs[element].text)]
+            elif element in tables:
+                lines = ['\t'.join(normalize_text(cell.text) for cell in row.cells) for row in tables[element].rows]
+            else:
+                continue
+            for line in lines:
+                if line and line not in seen:
+                    res += line + '\n'
+                    seen.add(line)
+        return res
 
-    with open(fr'D:\Mypower\Git\MyPython\大学\NLP\project\books\{name}.txt', 'w', encoding='utf-8') as f:
-        f.write(res)
\ No newline at end of file
+    start = time.perf_counter()
+    read_docx_old(path)
+    print(f'read_docx(旧): {time.perf_counter() - start:.2f}s')
+    start = time.perf_counter()
+    new = read_docx(path)
+    print(f'read_docx:     {time.perf_counter() - start:.2f}s')
+    print('与 python-docx 文本一致:', new == read_docx_ref(path))
@@ -1,40 +1,109 @@
+import os
 import re
-import tqdm
-import PyPDF2
-import pandas as pd
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from pypdf import PdfReader
+except ImportError:  # 旧环境中只安装了 PyPDF2, 接口一致
+    from PyPDF2 import PdfReader
+
+
+def clean_page(page_text):
+    """清洗单页文本: 去除行首尾空白与页码, 目录页和过短的页返回空字符串"""
+    raw_text = [text.strip() for text in page_text.strip().split('\n')]
+    new_text = '\n'.join(raw_text)
+    new_text = re.sub(r'\n\d{2,3}\s?', '\n', new_text)
+    if len(new_text) > 10 and '..............' not in new_text:
+        return new_text
+    return ''
+
+_pdf_reader = None  # 子进程中打开的 PDF, 每个进程只解析一次文件结构
+
+def _init_worker(file_path):
+    global _pdf_reader
+    _pdf_reader = PdfReader(file_path)
+
+def _extract_pages(start, end, pdf_reader=None):
+    # 提取 [start, end) 页的文本, 在子进程中使用进程初始化时打开的 PDF
+    pdf_reader = pdf_reader or _pdf_reader
+    return [clean_page(pdf_reader.pages[i].extract_text() or '') for i in range(start, end)]
+
 
 class Reader:
-    def __init__(self, corpus_path: str):
-        self.corpus = self.extract_pdf_page_text(corpus_path)
-
-    def extract_pdf_page_text(self, filepath, max_len=256, overlap_len=0):
-        page_content  = []
-        with open(filepath, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page in tqdm.tqdm(pdf_reader.pages, desc='解析PDF文件...'):
-                page_text = page.extract_text().strip()
-                raw_text = [text.strip() for text in page_text.split('\n')]
-                new_text = '\n'.join(raw_text)
-                new_text = re.sub(r'\n\d{2,3}\s?', '\n', new_text)
-                if len(new_text) > 10 and '..............' not in new_text:
-                    page_content.append(new_text)
-
-        cleaned_chunks = []
-        i = 0
-        # 暴力将整个pdf当做一个字符串，然后按照固定大小的滑动窗口切割
-        all_str = ''.join(page_content)
-        all_str = all_str.replace('\n', '')
-        while i < len(all_str):
-            cur_s = all_str[i:i+max_len]
-            if len(cur_s) > 10:
-                cleaned_chunks.append(cur_s)
-            i += (max_len - overlap_len)
-
-        return page_content
+    """
+        PDF 按页解析:
+        - 每 batch_pages 页为一批, 交给进程池并行提取, 同时处理中的批数不超过 2 * workers
+        - iter_pages() 按页码顺序逐页产出, 不在内存中保存整个文档
+        - 子进程以 spawn 方式启动: 调用方(入库线程)所在进程中有多个线程, fork 可能使子进程死锁
+    """
+    def __init__(self, corpus_path: str, workers=None, batch_pages=8):
+        self.path = corpus_path
+        self.workers = workers or int(os.environ.get('PDF_WORKERS') or 0) or os.cpu_count() or 1
+        self.batch_pages = batch_pages
+        self.num_pages = len(PdfReader(corpus_path).pages)
+
+    @property
+    def corpus(self):
+        # 全部有效页的文本列表
+        return [text for _, text in self.iter_pages()]
+
+    def iter_pages(self):
+        """
+            按页码顺序产出 (页码, 文本), 页码从 1 开始, 被清洗掉的页不产出
+        """
+        batches = [(start, min(start + self.batch_pages, self.num_pages))
+                   for start in range(0, self.num_pages, self.batch_pages)]
+        if self.workers <= 1 or len(batches) <= 1:
+            pdf_reader = PdfReader(self.path)
+            for start, end in batches:
+                yield from self._pages(start, _extract_pages(start, end, pdf_reader))
+            return
+
+        executor = ProcessPoolExecutor(max_workers=min(self.workers, len(batches)),
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker, initargs=(self.path,))
+        try:
+            todo = iter(batches)
+            pending = deque()
+            for start, end in todo:
+                pending.append((start, executor.submit(_extract_pages, start, end)))
+                if len(pending) >= 2 * self.workers:
+                    break
+            while pending:
+                start, future = pending.popleft()
+                texts = future.result()
+                nxt = next(todo, None)
+                if nxt is not None:  # 取走一批再提交一批, 处理中的批数保持不变
+                    pending.append((nxt[0], executor.submit(_extract_pages, *nxt)))
+                yield from self._pages(start, texts)
+        finally:
+            # 提前结束迭代或出错时不再等待剩余的批
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _pages(start, texts):
+        for i, text in enumerate(texts):
+            if text:
+                yield start + i + 1, text
+
 
 if __name__ == '__main__':
-    import os
-    print(os.getcwd())
-    reader = Reader('data/train_a.pdf')
-    with open('data/train_a.txt', 'w', encoding='utf-8') as f:
-        f.write('\n'.join(reader.corpus))
\ No newline at end of file
+    # 性能测试: 对比逐页串行解析与进程池并行解析
+    #   python read_pdf.py data/train_a.pdf --workers 4
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', default='data/train_a.pdf')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    serial = list(Reader(args.path, workers=1).iter_pages())
+    print(f'串行: {time.perf_counter() - start:.2f}s')
+    reader = Reader(args.path, workers=args.workers)
+    start = time.perf_counter()
+    parallel = list(reader.iter_pages())
+    print(f'并行({reader.workers} 进程): {time.perf_counter() - start:.2f}s')
+    print(f'页数: {reader.num_pages}, 有效页: {len(parallel)}, 结果一致: {serial == parallel}')
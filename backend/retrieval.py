@@ -0,0 +1,90 @@
+import time
+import asyncio
+
+__all__ = (
+    'RetrievalOrchestrator',
+)
+
+
+class RetrievalOrchestrator:
+    """
+        多路检索编排: 各检索源并发执行, 在截止时间内完成的结果才被使用, 超时的检索源被取消.
+        required=True 的检索源(如向量检索)不受截止时间限制, 总会等待其完成, 出错时异常直接抛给调用方;
+        可选检索源出错只在报告中记为 'error'.
+    """
+    def __init__(self, deadline_ms=800):
+        self.deadline = deadline_ms / 1000
+        self.sources = {}  # 名称 -> (协程函数, 是否必需)
+        self._stats = {}
+
+    def register(self, name, fn, required=False):
+        self.sources[name] = (fn, required)
+        self._stats[name] = {'calls': 0, 'used': 0, 'timeouts': 0, 'errors': 0, 'time': 0.0}
+
+    async def _timed(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self._stats[name]['time'] += time.perf_counter() - start
+
+    async def retrieve(self, *args, deadline_ms=None, **kwargs):
+        """
+            并发调用全部检索源, 参数原样传给各检索源
+        Returns:
+            (结果字典 {名称: 结果}, 报告 {名称: 'ok' | 'timeout' | 'error' | 'empty'})
+        """
+        deadline = self.deadline if deadline_ms is None else deadline_ms / 1000
+        loop = asyncio.get_running_loop()
+        tasks = {}
+        for name, (fn, _) in self.sources.items():
+            self._stats[name]['calls'] += 1
+            tasks[name] = loop.create_task(self._timed(name, fn, *args, **kwargs))
+
+        pending = set()
+        try:
+            optional = [task for name, task in tasks.items() if not self.sources[name][1]]
+            required = [task for name, task in tasks.items() if self.sources[name][1]]
+            if optional:
+                await asyncio.wait(optional, timeout=deadline)
+            if required:
+                await asyncio.wait(required)
+        finally:
+            # 超时的检索源, 或 retrieve 本身被取消(如客户端断开)时, 取消尚未完成的任务, 不再占用推理资源
+            pending = {task for task in tasks.values() if not task.done()}
+            for task in pending:
+                task.cancel()
+
+        results, report = {}, {}
+        error = None
+        for name, task in tasks.items():
+            stats = self._stats[name]
+            if task in pending:
+                stats['timeouts'] += 1
+                report[name] = 'timeout'
+            elif task.exception() is not None:
+                stats['errors'] += 1
+                report[name] = 'error'
+                print(f'ERROR: 检索源 {name} 报错:', str(task.exception()))
+                if self.sources[name][1]:
+                    error = task.exception()
+            elif not task.result():
+                report[name] = 'empty'
+            else:
+                stats['used'] += 1
+                results[name] = task.result()
+                report[name] = 'ok'
+        if error is not None:
+            # 必需的检索源出错(如推理线程池过载)时不能在没有上下文的情况下继续回答, 异常交给调用方处理
+            raise error
+        return results, report
+
+    def stats(self):
+        return {
+            'deadline_ms': self.deadline * 1000,
+            'sources': {
+                name: {'calls': s['calls'], 'used': s['used'], 'timeouts': s['timeouts'], 'errors': s['errors'],
+                       'avg_ms': s['time'] / s['calls'] * 1000 if s['calls'] else 0.0}
+                for name, s in self._stats.items()
+            },
+        }
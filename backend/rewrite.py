@@ -0,0 +1,83 @@
+import re
+import time
+import json
+import hashlib
+from cache import LRUCache
+
+__all__ = (
+    'QueryRewriter',
+)
+
+REWRITE_PROMPT = '''你需要根据历史信息和用户输入, 为我进行查询改写.\n---例如: 用户在历史信息中提问:厨房有什么东西?你回答有菜刀, 冰箱等. 然后用户提问:第一个的作用. 你应该改写查询为:厨房里菜刀的作用? 如果用户提问一个新的话题, 改写后的内容应该保持不变!如:历史提问:今天吃什么? 提问:明天去哪玩? 你应该保持不变, 输出:明天去哪玩?\n---重要的: 你应该除了改写后的输入, 其他什么都不要输出! \n---历史信息:{message}; \n---用户输入: {user_input} ---输出:'''
+
+# 指代或省略的常见表达, 出现时才需要结合历史改写
+ANAPHORA = re.compile(
+    r'它|他|她|这|那|其|该|此|上述|上面|前面|刚才|之前|上一|下一|第[一二三四五六七八九十\d]+|哪个|哪些|还有|呢[？?]?$'
+    r'|\b(it|its|they|them|their|this|that|these|those|he|she|him|her)\b',
+    re.IGNORECASE,
+)
+
+
+class QueryRewriter:
+    """
+        RAG 查询改写:
+        - 没有历史对话, 或问题中没有指代/省略时, 直接使用原问题, 不调用 LLM
+        - 改写结果按 (历史摘要, 用户输入) 缓存, 带 LRU 与 TTL
+        - stream=True 时流式读取改写结果, 读到第一行完整输出即返回, 不等待 LLM 结束
+    """
+    def __init__(self, llm, maxsize=1024, ttl=600, stream=True, short_len=4):
+        self.llm = llm
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.stream = stream
+        self.short_len = short_len  # 不超过该长度的问题多为省略句, 也需要改写
+        self.calls = 0
+        self.skips = 0
+        self.llm_time = 0.0
+
+    @staticmethod
+    def _digest(message):
+        return hashlib.sha1(json.dumps(message, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def needs_rewrite(self, message, user_input):
+        # message 为包含当前输入在内的对话消息, 最后一条为当前输入
+        history = [m for m in message[:-1] if m.get('type') != 'system']
+        if not history:
+            return False
+        return len(user_input.strip()) <= self.short_len or ANAPHORA.search(user_input) is not None
+
+    async def _call_llm(self, prompt):
+        if not self.stream:
+            return (await self.llm.ainvoke([{'role': 'user', 'content': prompt}])).content
+        res = ''
+        async for chunk in self.llm.astream([{'role': 'user', 'content': prompt}]):
+            res += chunk.content or ''
+            if '\n' in res.strip():  # 改写结果只有一行, 读到换行即可开始检索
+                break
+        return res.strip().split('\n')[0]
+
+    async def rewrite(self, message, user_input):
+        if not self.needs_rewrite(message, user_input):
+            self.skips += 1
+            return user_input
+        key = (self._digest(message), user_input)
+        res = self.cache.get(key)
+        if res is not None:
+            return res
+        start = time.perf_counter()
+        res = await self._call_llm(REWRITE_PROMPT.format(message=message, user_input=user_input))
+        self.llm_time += time.perf_counter() - start
+        self.calls += 1
+        res = res.strip() or user_input
+        self.cache.set(key, res)
+        return res
+
+    def stats(self):
+        avg = self.llm_time / self.calls if self.calls else 0.0
+        return {
+            'calls': self.calls,
+            'skips': self.skips,
+            'cache': self.cache.stats(),
+            'avg_llm_ms': avg * 1000,
+            # 跳过与命中缓存的请求按平均 LLM 耗时估算节省的时间
+            'time_saved_s': (self.skips + self.cache.hits) * avg,
+        }
@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+__all__ = (
+    'SemanticCache',
+)
+
+
+class SemanticCache:
+    """
+        语义答案缓存: 以改写后查询的向量为键, 相似度超过 threshold 且知识库版本一致时,
+        直接回放缓存的流式回答. 条目数较少, 使用归一化向量矩阵做精确最近邻检索.
+        支持 LRU 淘汰, TTL 过期, 以及知识库变化时整体失效.
+    """
+    def __init__(self, threshold=0.92, maxsize=512, ttl=3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # 条目 id -> (向量, 查询, 回答片段, 知识库版本, 过期时间)
+        self._matrix = None  # 向量矩阵缓存
+        self._matrix_ids = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _rebuild(self):
+        self._matrix_ids = list(self._entries.keys())
+        if self._matrix_ids:
+            self._matrix = np.stack([self._entries[i][0] for i in self._matrix_ids])
+        else:
+            self._matrix = None
+
+    def lookup(self, vector, version):
+        """
+            查找相似问题的缓存回答
+        Returns:
+            (回答片段列表, 相似度), 未命中时返回 (None, 最高相似度)
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        now = time.monotonic()
+        with self._lock:
+            expired = [i for i, entry in self._entries.items() if entry[4] < now or entry[3] != version]
+            for i in expired:
+                del self._entries[i]
+            if expired or (self._matrix is None and self._entries):
+                self._rebuild()
+            if self._matrix is None:
+                self.misses += 1
+                return None, 0.0
+            sims = self._matrix @ vector
+            best = int(np.argmax(sims))
+            sim = float(sims[best])
+            if sim < self.threshold:
+                self.misses += 1
+                return None, sim
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id][2], sim
+
+    def store(self, vector, query, chunks, version):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._entries[self._next_id] = (vector, query, list(chunks), version, time.monotonic() + self.ttl)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._rebuild()
+
+    def invalidate(self):
+        # 知识库上传或删除文件后清空缓存
+        with self._lock:
+            self._entries.clear()
+            self._rebuild()
+            self.invalidations += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,96 @@
+import time
+import json
+import asyncio
+
+__all__ = (
+    'sse_event',
+    'sse_stream',
+)
+
+_END = object()
+
+
+def sse_event(data, event=None):
+    # 按 SSE 格式封装一个事件, data 为可 JSON 序列化的对象
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+async def sse_stream(source, flush_bytes=64, flush_interval=0.05, max_buffer=256):
+    """
+        将 LLM 输出流转换为 SSE 事件流:
+        - 第一个 token 立即发送, 降低首字延迟
+        - 之后的 token 合并发送, 累计达到 flush_bytes 字节或距上次发送超过 flush_interval 秒时发送
+        - 上游数据先进入容量为 max_buffer 的队列, 客户端读取过慢时队列写满, 上游随之暂停(背压)
+        - 结束时发送 done 事件, 出错时发送 error 事件
+    Args:
+        source: 异步迭代器, 产出 str(回答文本) 或 {'event': 事件名, 'data': 数据}(其他类型事件, 立即发送)
+    """
+    queue = asyncio.Queue(maxsize=max_buffer)
+
+    async def produce():
+        try:
+            async for item in source:
+                await queue.put(item)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.get_running_loop().create_task(produce())
+    buffer = []
+    size = 0
+    first = True
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal buffer, size, last_flush
+        text = ''.join(buffer)
+        buffer, size, last_flush = [], 0, time.monotonic()
+        return sse_event({'content': text})
+
+    try:
+        while True:
+            if buffer:
+                timeout = max(0.0, last_flush + flush_interval - time.monotonic())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield flush()
+                    continue
+            else:
+                item = await queue.get()
+
+            if item is _END:
+                if buffer:
+                    yield flush()
+                yield sse_event({}, event='done')
+                return
+            if isinstance(item, Exception):
+                if buffer:
+                    yield flush()
+                error_response = {'error': str(item), 'done': True}
+                print(f"发生错误: {error_response}")
+                yield sse_event(error_response, event='error')
+                yield sse_event({}, event='done')
+                return
+            if isinstance(item, dict):
+                # 非文本事件(如工具调用进度)单独发送, 先发送已缓存的文本保证顺序
+                if buffer:
+                    yield flush()
+                yield sse_event(item.get('data', {}), event=item['event'])
+                continue
+            if not item:
+                continue
+            buffer.append(item)
+            size += len(item.encode('utf-8'))
+            if first or size >= flush_bytes:
+                first = False
+                yield flush()
+    finally:
+        # 客户端断开时停止上游生成
+        producer.cancel()
@@ -0,0 +1,88 @@
+"""
+    MCPToolPool 与本地桩服务 MCP/stub_server.py 的集成测试, 在 backend 目录下运行:
+        python -m pytest tests
+"""
+import os
+import sys
+import asyncio
+import importlib.util
+import pytest
+
+pytest.importorskip('mcp')
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# 直接加载 pool.py, 不导入 MCP 包(包的 __init__ 会加载 LLM 与 agent)
+_spec = importlib.util.spec_from_file_location('mcp_pool', os.path.join(BACKEND_DIR, 'MCP', 'pool.py'))
+pool_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(pool_module)
+MCPToolPool = pool_module.MCPToolPool
+MCPServer = pool_module.MCPServer
+
+STUB_CONFIG = {
+    'timeout': 10,
+    'type': 'stdio',
+    'command': sys.executable,
+    'args': [os.path.join(BACKEND_DIR, 'MCP', 'stub_server.py')],
+    'cache_ttl': {'add': 60},
+}
+
+
+def _processes(marker):
+    # 命令行中包含 marker 的进程 id 列表
+    pids = []
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if marker.encode() in f.read():
+                    pids.append(int(pid))
+        except OSError:
+            pass
+    return pids
+
+
+def test_pool_with_stub_server():
+    async def main():
+        pool = MCPToolPool({'stub': STUB_CONFIG}, health_interval=60)
+        await pool.start()
+        try:
+            server = pool.servers['stub']
+            assert server.alive
+            assert {tool.name for tool in server.tools} == {'echo', 'add', 'sleep'}
+            assert {tool.name for tool in pool.get_tools()} == {'echo', 'add', 'sleep'}
+
+            assert await pool.call_tool('stub', 'echo', {'text': '你好'}) == '你好'
+            # 参数顺序不同视为同一调用, 第二次命中缓存
+            assert float(await pool.call_tool('stub', 'add', {'a': 1, 'b': 2})) == 3
+            assert float(await pool.call_tool('stub', 'add', {'b': 2, 'a': 1})) == 3
+            assert pool.cache.stats()['hits'] == 1
+
+            echo = next(tool for tool in pool.get_tools() if tool.name == 'echo')
+            assert await echo.ainvoke({'text': 'x'}) == 'x'
+            assert pool.stats()['servers']['stub']['calls'] == 3
+        finally:
+            await pool.stop()
+        assert not pool.servers['stub'].alive
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='需要 /proc 检查子进程')
+def test_start_timeout_stops_process():
+    # 不响应 initialize 的服务: 启动超时后子进程应被关闭
+    marker = 'mcp_start_timeout_marker'
+    config = {'timeout': 1, 'type': 'stdio', 'command': sys.executable,
+              'args': ['-c', f'import time; time.sleep(30)  # {marker}']}
+
+    async def main():
+        server = MCPServer('hang', config)
+        with pytest.raises(asyncio.TimeoutError):
+            await server.start()
+        assert server._task is None
+        await asyncio.sleep(0.5)
+        assert _processes(marker) == []
+
+    asyncio.run(main())
@@ -2,7 +2,7 @@ import axios from 'axios'
 
 const API_BASE_URL = 'http://localhost:8000'
 
-export const processTextAPI = async (messages, onData, useRAG = false, useMCP = false) => {
+export const processTextAPI = async (messages, onData, useRAG = false, useMCP = false, onEvent = null) => {
   try {
     const response = await fetch(`${API_BASE_URL}/api/process`, {
       method: 'POST',
@@ -16,15 +16,35 @@ export const processTextAPI = async (messages, onData, useRAG = false, useMCP =
       }),
     })
 
+    if (!response.ok) {
+      throw new Error(`请求失败: ${response.status}`)
+    }
+
     const reader = response.body.getReader()
     const decoder = new TextDecoder()
+    let buffer = ''
 
+    // 解析 SSE 事件流: 事件之间以空行分隔, 每个事件包含可选的 event 行和 data 行
     while (true) {
       const { done, value } = await reader.read()
       if (done) break
 
-      const chunk = decoder.decode(value)
-      onData(chunk)
+      buffer += decoder.decode(value, { stream: true })
+      const events = buffer.split('\n\n')
+      buffer = events.pop()
+      for (const raw of events) {
+        let event = 'message'
+        let data = ''
+        for (const line of raw.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim()
+          else if (line.startsWith('data:')) data += line.slice(5).trim()
+        }
+        const payload = data ? JSON.parse(data) : {}
+        if (event === 'done') return
+        if (event === 'error') throw new Error(payload.error)
+        if (event === 'message') onData(payload.content)
+        else if (onEvent) onEvent(event, payload)
+      }
     }
   } catch (error) {
     console.error('API调用失败:', error)
@@ -57,6 +77,29 @@ export const uploadFileAPI = async (formData) => {
   }
 };
 
+// 轮询入库任务进度, 直到完成或失败
+export const waitIngestJobAPI = async (jobId, onProgress = null, interval = 1000) => {
+  const jobInfo = toast.info('正在建立索引...', { duration: 0 });
+  try {
+    while (true) {
+      const { data: job } = await axios.get(`${API_BASE_URL}/api/ingest-jobs/${jobId}`)
+      if (job.status === 'done') {
+        jobInfo.dismiss()
+        toast.success('索引建立完成!', { duration: 1500 });
+        return job
+      }
+      if (job.status === 'failed') throw new Error(job.error)
+      if (onProgress) onProgress(job)
+      await new Promise(resolve => setTimeout(resolve, interval))
+    }
+  } catch (error) {
+    console.error('建立索引失败:', error)
+    jobInfo.dismiss()
+    toast.error('建立索引失败', { duration: 1500 });
+    throw error
+  }
+}
+
 export const getKnowledgeBaseAPI = async () => {
   try {
     const response = await axios.get(`${API_BASE_URL}/api/knowledge-base`)